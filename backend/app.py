@@ -1,14 +1,94 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Form
+from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
-import PyPDF2
-import io
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from functools import cache
+import asyncio
+import json
+import os
 import re
+import time
 
-from utils.data_extractor import extract_structured_data
-from utils.interpretador import interpretar_exame
-from utils.analysis_generator import generate_ai_analysis_rag, generate_ai_analysis_no_rag
+from utils.data_extractor import (
+    extract_structured_data,
+    obter_indice_termos,
+    prompt_extrator,
+    chave_documento,
+    buscar_extracao_em_cache,
+    salvar_extracao_em_cache,
+    estatisticas_cache_documentos,
+    estatisticas_prompt_extrator,
+)
+from utils.interpretador import interpretar_lote, obter_indice, desvio_da_referencia
+from utils.resolvedor_termos import obter_resolvedor, estatisticas_resolvedor
+from utils.glossario import lista_termos, carregado as glossario_carregado
+from utils.pdf_reader import extrair_texto_pdf, encerrar_pool, LimitePdfExcedido
+from utils.triagem import validar_documento, DocumentoRejeitado
+from utils.cache import VooUnico
+from utils.upload import UPLOAD_MAX_BYTES, UploadMuitoGrande, UploadRecebido, mensagem_limite, receber_upload
+from utils.jobs import JOBS_MAX_ARQUIVOS, JOBS_MAX_BYTES, FilaCheia, FilaDeJobs, obter_job, obter_resultado_job
+from utils.llm_client import LLMIndisponivel, obter_backend, fechar as fechar_llm
+from utils.metricas import SERVER_TIMING_ATIVO, iniciar_requisicao, medir, renderizar, requisicao_segundos, server_timing
+from utils.analysis_generator import (
+    generate_ai_analysis_rag,
+    generate_ai_analysis_no_rag,
+    generate_ai_analyses_batch,
+    estatisticas_cache_analises,
+    registrar_pedido_analise,
+    buscar_pedido_analise,
+)
+
+# Limites de concorrência das análises de IA: por requisição e para o processo todo
+ANALISE_CONCORRENCIA_REQUISICAO = int(os.getenv("MEDBOT_ANALISE_CONCORRENCIA", "4"))
+ANALISE_CONCORRENCIA_GLOBAL = int(os.getenv("MEDBOT_ANALISE_CONCORRENCIA_GLOBAL", "16"))
+ANALISE_TIMEOUT_SEGUNDOS = float(os.getenv("MEDBOT_ANALISE_TIMEOUT", "30"))
+# Em lote, todas as análises de um laudo saem de uma única chamada ao modelo
+ANALISE_EM_LOTE = os.getenv("MEDBOT_ANALISE_EM_LOTE", "1") == "1"
+ANALISE_LOTE_TIMEOUT_SEGUNDOS = float(os.getenv("MEDBOT_ANALISE_LOTE_TIMEOUT", "60"))
+# Sob demanda, a resposta traz só um `analise_id` por resultado alterado e a análise é pedida
+# em /analysis/{analise_id}/; os N achados mais fora da referência podem ser gerados em segundo plano
+ANALISE_SOB_DEMANDA = os.getenv("MEDBOT_ANALISE_SOB_DEMANDA", "0") == "1"
+ANALISE_PREFETCH = int(os.getenv("MEDBOT_ANALISE_PREFETCH", "0"))
+
+_semaforo_global_analises = asyncio.Semaphore(ANALISE_CONCORRENCIA_GLOBAL)
+
+# Referências às tarefas de prefetch, para que não sejam coletadas antes de terminar
+_tarefas_prefetch: set[asyncio.Task] = set()
 
-app = FastAPI(title="MedBot API - Analisador de Resultados", version="5.0")
+# O mesmo PDF enviado duas vezes ao mesmo tempo (duplo clique, nova tentativa) é extraído uma vez só
+_voo_documentos = VooUnico("documentos")
+
+# Estado do aquecimento, consultado pelo /health/ready
+_estado = {"aquecido": False, "llm_pronto": False, "aquecimento_ms": None}
+
+def aquecer() -> None:
+    """Lê o glossário e compila todos os índices derivados dele."""
+    obter_indice()
+    obter_indice_termos()
+    obter_resolvedor()
+    prompt_extrator()
+    relacoes_glossario()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nada pesado acontece no import: o aquecimento roda aqui, uma vez por worker
+    inicio = time.perf_counter()
+    await asyncio.to_thread(aquecer)
+    try:
+        obter_backend()
+        _estado["llm_pronto"] = True
+    except ValueError as e:
+        print(f"Cliente do modelo não configurado: {e}")
+    _estado["aquecimento_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    _estado["aquecido"] = True
+    print(f"MedBot pronto em {_estado['aquecimento_ms']} ms.")
+    _fila_jobs.iniciar()
+    yield
+    await _fila_jobs.encerrar()
+    encerrar_pool()
+    await fechar_llm()
+
+app = FastAPI(title="MedBot API - Analisador de Resultados", version="5.0", lifespan=lifespan)
 
 origins = ["http://localhost:3000"]
 app.add_middleware(
@@ -19,23 +99,115 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def instrumentar(request: Request, call_next):
+    """Mede a requisição e, se MEDBOT_SERVER_TIMING=1, devolve os tempos das etapas no cabeçalho Server-Timing."""
+    tempos = iniciar_requisicao()
+    inicio = time.perf_counter()
+    response = await call_next(request)
+    duracao = time.perf_counter() - inicio
+    rota = request.scope.get("route")
+    requisicao_segundos.observar(duracao, getattr(rota, "path", "desconhecida"), request.method, str(response.status_code))
+    if SERVER_TIMING_ATIVO and tempos:
+        response.headers["Server-Timing"] = server_timing({**tempos, "total": duracao})
+    return response
+
+# Folga para os cabeçalhos e campos do multipart além do próprio PDF
+MARGEM_MULTIPART_BYTES = 64 * 1024
+
+@app.middleware("http")
+async def limitar_upload(request: Request, call_next):
+    """Recusa pelo Content-Length, antes de ler o corpo, uploads maiores que o limite."""
+    tamanho = request.headers.get("content-length", "")
+    # Lotes têm um limite próprio para o corpo inteiro; cada arquivo ainda respeita UPLOAD_MAX_BYTES
+    if request.url.path == "/analyze-pdf/batch/":
+        limite, mensagem = JOBS_MAX_BYTES, f"O lote passou do limite de {round(JOBS_MAX_BYTES / (1024 * 1024), 1):g} MB."
+    else:
+        limite, mensagem = UPLOAD_MAX_BYTES, mensagem_limite()
+    if request.method == "POST" and tamanho.isdigit() and int(tamanho) > limite + MARGEM_MULTIPART_BYTES:
+        return JSONResponse(status_code=413, content={"detail": mensagem})
+    return await call_next(request)
+
 @app.get("/")
 def root():
     return {"message": "MedBot API com Análise de Resultados rodando."}
 
+@app.get("/health/live")
+def health_live():
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+def health_ready():
+    estado = {
+        "glossario": glossario_carregado(),
+        "indices": _estado["aquecido"],
+        "llm": _estado["llm_pronto"],
+        "aquecimento_ms": _estado["aquecimento_ms"],
+    }
+    pronto = estado["glossario"] and estado["indices"] and estado["llm"]
+    return JSONResponse(status_code=200 if pronto else 503, content={"status": "pronto" if pronto else "aquecendo", **estado})
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(renderizar(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache-stats/")
+def cache_stats():
+    return {
+        "analises": estatisticas_cache_analises(),
+        "documentos": {**estatisticas_cache_documentos(), "coalescencia": _voo_documentos.estatisticas()},
+        "prompt_extrator": estatisticas_prompt_extrator(),
+        "resolvedor_termos": estatisticas_resolvedor(),
+    }
+
+def _relacoes_por_substring(nomes) -> dict[str, set[str]]:
+    """Para cada nome, os outros nomes que o contêm ou que estão contidos nele."""
+    relacoes = {nome: set() for nome in nomes}
+    for nome in relacoes:
+        for outro in relacoes:
+            if nome != outro and nome in outro:
+                relacoes[nome].add(outro)
+                relacoes[outro].add(nome)
+    return relacoes
+
+# Tabela pré-calculada entre as chaves do glossário (ex: "h.c.m." <-> "c.h.c.m.")
+@cache
+def relacoes_glossario() -> dict[str, set[str]]:
+    return _relacoes_por_substring(lista_termos())
+
+def _relacoes_do_laudo(nomes: set[str]) -> dict[str, set[str]]:
+    """Relações de substring entre os nomes de um laudo, consultando a tabela do glossário sempre que possível."""
+    tabela = relacoes_glossario()
+    conhecidos = {nome for nome in nomes if nome in tabela}
+    relacoes = {nome: tabela[nome] & conhecidos for nome in conhecidos}
+    # Só os nomes fora do glossário precisam ser comparados com os demais
+    for desconhecido in nomes - conhecidos:
+        relacoes[desconhecido] = set()
+        for outro in nomes:
+            if outro != desconhecido and (desconhecido in outro or outro in desconhecido):
+                relacoes[desconhecido].add(outro)
+                relacoes.setdefault(outro, set()).add(desconhecido)
+    return relacoes
+
 def merge_related_results(results):
+    # Índice nome -> posições, para achar os relacionados sem comparar todos os pares
+    posicoes_por_nome = {}
+    for j, result in enumerate(results):
+        nome = result.get("exame", "")
+        if nome:
+            posicoes_por_nome.setdefault(nome, []).append(j)
+    relacoes = _relacoes_do_laudo(set(posicoes_por_nome))
+
     merged_results = []
     processed_indices = set()
     for i, current_result in enumerate(results):
         if i in processed_indices: continue
         base_name = current_result.get("exame", "")
         if not base_name: continue
-        related_indices = [i]
-        for j, other_result in enumerate(results):
-            other_exam_name = other_result.get("exame", "")
-            if not other_exam_name: continue
-            if i != j and j not in processed_indices and (base_name in other_exam_name or other_exam_name in base_name):
-                related_indices.append(j)
+        candidatos = list(posicoes_por_nome[base_name])
+        for nome in relacoes[base_name]:
+            candidatos.extend(posicoes_por_nome[nome])
+        related_indices = [i] + [j for j in sorted(candidatos) if j != i and j not in processed_indices]
         if len(related_indices) > 1:
             valid_results = [results[k] for k in related_indices if "valor" in results[k] and "unidade" in results[k]]
             if not valid_results: continue
@@ -49,64 +221,346 @@ def merge_related_results(results):
             processed_indices.add(i)
     return merged_results
 
+def valor_numerico(valor_str: str) -> float | None:
+    valor_numerico_str = re.split(r'\s|/', valor_str)[0]
+    try:
+        cleaned_valor = re.sub(r"[^0-9,.]", "", valor_numerico_str).replace(",", ".")
+        if cleaned_valor: return float(cleaned_valor)
+    except (ValueError, TypeError): pass
+    return None
+
+def interpretar_grupos(structured_data: dict, idade: int, sexo: str) -> list[dict]:
+    """Junta os resultados relacionados e interpreta todos os exames do laudo em um único lote."""
+    grupos = []
+    with medir("merge"):
+        for group in structured_data.get("grupos", []):
+            resultados = []
+            for result in merge_related_results(group.get("resultados", [])):
+                if not result.get("exame"): continue
+                valor_str = str(result.get("valor", "")).strip()
+                resultados.append((result, valor_str, valor_numerico(valor_str)))
+            if resultados:
+                grupos.append((group.get("grupo", "Grupo Desconhecido"), resultados))
+
+    with medir("interpretacao"):
+        interpretacoes = iter(interpretar_lote([
+            (result["exame"], valor_float, idade, sexo)
+            for _, resultados in grupos
+            for result, _, valor_float in resultados
+        ]))
+
+    analyzed_groups = []
+    for group_name, resultados in grupos:
+        interpreted_results = []
+        for result, valor_str, _ in resultados:
+            interpretacao, status = next(interpretacoes)
+            interpreted_results.append({
+                "exame": result["exame"],
+                "valor": valor_str,
+                "unidade": result.get("unidade", ""),
+                "interpretacao": interpretacao,
+                "analise_ia": None,
+                "status_class": status,
+            })
+        analyzed_groups.append({"group_name": group_name, "results": interpreted_results})
+    return analyzed_groups
+
+async def gerar_analise_limitada(exame, valor_str, status, interpretacao, idade, sexo, rag, semaforo_requisicao):
+    """Gera a análise de IA respeitando os limites de concorrência e o timeout por chamada."""
+    async with semaforo_requisicao, _semaforo_global_analises:
+        if rag:
+            coro = generate_ai_analysis_rag(exame, valor_str, status, interpretacao, idade, sexo)
+        else:
+            coro = generate_ai_analysis_no_rag(exame, valor_str, status, idade, sexo)
+        try:
+            return await asyncio.wait_for(coro, timeout=ANALISE_TIMEOUT_SEGUNDOS)
+        except asyncio.TimeoutError:
+            return {
+                "titulo": "Tempo Esgotado na Análise",
+                "analise": f"A análise não foi concluída em {ANALISE_TIMEOUT_SEGUNDOS:g} segundos.",
+                "recomendacao": "",
+                "alerta": "",
+            }
+
+async def extrair_dados(upload: UploadRecebido) -> dict:
+    """Lê o PDF e extrai os grupos estruturados, usando o cache por documento."""
+    # Reenvios do mesmo PDF pulam tanto o PyPDF2 quanto a chamada ao modelo
+    with medir("cache_documento"):
+        chave = chave_documento(upload.sha256)
+        structured_data = buscar_extracao_em_cache(chave)
+    if structured_data is None:
+        structured_data = await _voo_documentos.executar(chave, lambda: _extrair_e_salvar(upload, chave))
+    return structured_data
+
+async def _extrair_e_salvar(upload: UploadRecebido, chave: str) -> dict:
+    with medir("pdf"):
+        text = await extrair_texto_pdf(upload.fonte)
+    # Documentos que não são laudos são recusados antes da chamada ao gpt-4o
+    with medir("triagem"):
+        await validar_documento(text, obter_indice_termos())
+    with medir("extracao"):
+        structured_data = await extract_structured_data(text)
+    salvar_extracao_em_cache(chave, structured_data)
+    return structured_data
+
+def resultados_alterados(analyzed_groups: list[dict]):
+    """Percorre (índice do grupo, índice do resultado, resultado) dos exames "alto"/"baixo"."""
+    for group_index, group in enumerate(analyzed_groups):
+        for result_index, result in enumerate(group["results"]):
+            if result["status_class"] in ["alto", "baixo"]:
+                yield group_index, result_index, result
+
+async def gerar_analises(alterados: list[dict], idade: int, sexo: str, rag: bool) -> list[dict]:
+    """
+    Gera as análises dos resultados alterados, na mesma ordem. No modo em lote faz uma única
+    chamada ao modelo e só repete individualmente os itens que faltaram ou vieram inválidos.
+    """
+    analises = [None] * len(alterados)
+    if ANALISE_EM_LOTE and len(alterados) > 1:
+        itens = [
+            {"term": r["exame"], "value": r["valor"], "status": r["status_class"], "interpretation": r["interpretacao"]}
+            for r in alterados
+        ]
+        try:
+            async with _semaforo_global_analises:
+                with medir("analise_lote"):
+                    analises = await asyncio.wait_for(
+                        generate_ai_analyses_batch(itens, idade, sexo, rag), timeout=ANALISE_LOTE_TIMEOUT_SEGUNDOS,
+                    )
+        except asyncio.TimeoutError:
+            print("Análise em lote excedeu o tempo limite; gerando individualmente.")
+
+    faltantes = [i for i, analise in enumerate(analises) if analise is None]
+    semaforo_requisicao = asyncio.Semaphore(ANALISE_CONCORRENCIA_REQUISICAO)
+    individuais = await asyncio.gather(*(
+        gerar_analise_limitada(
+            alterados[i]["exame"], alterados[i]["valor"], alterados[i]["status_class"], alterados[i]["interpretacao"],
+            idade, sexo, rag, semaforo_requisicao,
+        )
+        for i in faltantes
+    ))
+    for i, analise in zip(faltantes, individuais):
+        analises[i] = analise
+    return analises
+
+def preparar_analises_sob_demanda(alterados: list[dict], idade: int, sexo: str, rag: bool) -> None:
+    """Troca a geração imediata por um `analise_id` em cada resultado e agenda o prefetch dos principais."""
+    for result in alterados:
+        result["analise_id"] = registrar_pedido_analise(
+            result["exame"], result["valor"], result["status_class"], result["interpretacao"], idade, sexo, rag,
+        )
+    if ANALISE_PREFETCH <= 0 or not alterados:
+        return
+
+    def desvio(result):
+        valor = valor_numerico(result["valor"])
+        return desvio_da_referencia(result["exame"], valor, idade, sexo) if valor is not None else 0.0
+
+    principais = sorted(alterados, key=desvio, reverse=True)[:ANALISE_PREFETCH]
+    # Cópias: o prefetch só aquece o cache, a resposta já foi montada sem as análises
+    tarefa = asyncio.create_task(gerar_analises([dict(r) for r in principais], idade, sexo, rag))
+    _tarefas_prefetch.add(tarefa)
+    tarefa.add_done_callback(_tarefas_prefetch.discard)
+
 @app.post("/analyze-pdf/")
 async def analyze_pdf(
     file: UploadFile = File(...),
     idade: int = Form(...),
     sexo: str = Form(...),
-    rag: bool = Form(True) 
+    rag: bool = Form(True),
+    sob_demanda: bool = Form(ANALISE_SOB_DEMANDA),
 ):
     try:
-        pdf_content = await file.read()
-        text = "".join(page.extract_text() or "" for page in PyPDF2.PdfReader(io.BytesIO(pdf_content)).pages)
+        upload = await receber_upload(file)
+    except UploadMuitoGrande as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return await analisar_documento(upload, file.filename, idade, sexo, rag, sob_demanda)
 
-        structured_data = await extract_structured_data(text)
+async def analisar_documento(upload: UploadRecebido, filename: str, idade: int, sexo: str, rag: bool = True, sob_demanda: bool = False) -> dict:
+    """Pipeline completo de um PDF já recebido, usado pelo /analyze-pdf/ e pelos jobs em lote."""
+    try:
+        try:
+            structured_data = await extrair_dados(upload)
+        finally:
+            upload.fechar()
+        analyzed_groups = interpretar_grupos(structured_data, idade, sexo)
 
-        analyzed_groups = []
-        for group in structured_data.get("grupos", []):
-            resultados_do_grupo = group.get("resultados", [])
-            merged_results_list = merge_related_results(resultados_do_grupo)
-            interpreted_results = []
+        # As análises rodam em lote ou em paralelo; os resultados já estão na ordem original
+        alterados = [result for _, _, result in resultados_alterados(analyzed_groups)]
+        if sob_demanda:
+            # A latência da resposta não depende mais do número de resultados alterados
+            preparar_analises_sob_demanda(alterados, idade, sexo, rag)
+        else:
+            with medir("analises"):
+                analises = await gerar_analises(alterados, idade, sexo, rag)
+            for result, analise_ia in zip(alterados, analises):
+                result["analise_ia"] = analise_ia
 
-            for result in merged_results_list:
-                exam_name = result.get("exame")
-                if not exam_name: continue
+        # Adiciona o modo RAG usado à resposta
+        return {"filename": filename, "groups": analyzed_groups, "rag_mode_used": rag, "analise_sob_demanda": sob_demanda}
 
-                valor_str = str(result.get("valor", "")).strip()
-                valor_numerico_str = re.split(r'\s|/', valor_str)[0]
-                
-                valor_float = None
-                try:
-                    cleaned_valor = re.sub(r"[^0-9,.]", "", valor_numerico_str).replace(",", ".")
-                    if cleaned_valor: valor_float = float(cleaned_valor)
-                except (ValueError, TypeError): pass
-
-                interpretacao, status = interpretar_exame(result["exame"], valor_float, idade, sexo)
-                
-                analise_ia = None
-                if status in ["alto", "baixo"]:
-                    if rag:
-                        analise_ia = await generate_ai_analysis_rag(result["exame"], valor_str, status, interpretacao, idade, sexo)
-                    else:
-                        analise_ia = await generate_ai_analysis_no_rag(result["exame"], valor_str, status, idade, sexo)
-                
-                interpreted_results.append({
-                    "exame": result["exame"],
-                    "valor": valor_str,
-                    "unidade": result.get("unidade", ""),
-                    "interpretacao": interpretacao,
-                    "analise_ia": analise_ia,
-                    "status_class": status,
-                })
-            
-            if interpreted_results:
-                analyzed_groups.append({
-                    "group_name": group.get("grupo", "Grupo Desconhecido"),
-                    "results": interpreted_results,
-                })
+    except (LimitePdfExcedido, UploadMuitoGrande) as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except DocumentoRejeitado as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except LLMIndisponivel as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Ocorreu um erro inesperado no servidor: {str(e)}")
 
-        # Adiciona o modo RAG usado à resposta
-        return {"filename": file.filename, "groups": analyzed_groups, "rag_mode_used": rag}
+# Workers dos jobs em lote (iniciados no lifespan); usam a mesma rotina do /analyze-pdf/
+_fila_jobs = FilaDeJobs(analisar_documento)
+
+@app.post("/analyze-pdf/batch/", status_code=202)
+async def analyze_pdf_batch(
+    files: list[UploadFile] = File(...),
+    idade: list[int] = Form(...),
+    sexo: list[str] = Form(...),
+    rag: bool = Form(True),
+    sob_demanda: bool = Form(False),
+):
+    """
+    Recebe vários PDFs, cada um com sua idade e sexo (na mesma ordem dos arquivos; um único
+    valor vale para todos), e devolve um job_id na hora. O andamento é consultado em
+    /jobs/{job_id}/ e o resultado de cada arquivo em /jobs/{job_id}/results/{indice}/.
+    """
+    if len(files) > JOBS_MAX_ARQUIVOS:
+        raise HTTPException(status_code=413, detail=f"O lote passou do limite de {JOBS_MAX_ARQUIVOS} arquivos.")
+    if len(idade) == 1:
+        idade = idade * len(files)
+    if len(sexo) == 1:
+        sexo = sexo * len(files)
+    if len(idade) != len(files) or len(sexo) != len(files):
+        raise HTTPException(status_code=422, detail="Envie uma idade e um sexo por arquivo (ou um único valor para todos).")
+
+    arquivos = []
+    try:
+        for file, idade_arquivo, sexo_arquivo in zip(files, idade, sexo):
+            try:
+                upload = await receber_upload(file)
+            except UploadMuitoGrande as e:
+                raise HTTPException(status_code=413, detail=f"{file.filename}: {e}")
+            arquivos.append((file.filename, upload, idade_arquivo, sexo_arquivo))
+        job = _fila_jobs.criar_job(arquivos, rag=rag, sob_demanda=sob_demanda)
+    except FilaCheia as e:
+        for _, upload, _, _ in arquivos:
+            upload.fechar()
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "60"})
+    except BaseException:
+        for _, upload, _, _ in arquivos:
+            upload.fechar()
+        raise
+    return {"job_id": job["job_id"], "status": job["status"], "total": job["total"]}
 
+@app.get("/jobs/{job_id}/")
+def job_status(job_id: str):
+    """Andamento do job: status geral, contadores e o status de cada arquivo."""
+    job = obter_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job não encontrado ou expirado.")
+    return job
+
+@app.get("/jobs/{job_id}/results/{indice}/")
+def job_result(job_id: str, indice: int):
+    """Resultado de um arquivo do job, no mesmo formato do /analyze-pdf/."""
+    job = obter_job(job_id)
+    if job is None or not 0 <= indice < job["total"]:
+        raise HTTPException(status_code=404, detail="Job ou arquivo não encontrado.")
+    arquivo = job["arquivos"][indice]
+    if arquivo["status"] == "erro":
+        raise HTTPException(status_code=arquivo["status_http"] or 500, detail=arquivo["erro"])
+    if arquivo["status"] != "concluido":
+        # Ainda na fila ou em processamento
+        return JSONResponse(status_code=202, content={"status": arquivo["status"]}, headers={"Retry-After": "5"})
+    resultado = obter_resultado_job(job_id, indice)
+    if resultado is None:
+        raise HTTPException(status_code=404, detail="Resultado expirado. Envie o arquivo novamente.")
+    return resultado
+
+@app.post("/analyze-pdf/stream/")
+async def analyze_pdf_stream(
+    file: UploadFile = File(...),
+    idade: int = Form(...),
+    sexo: str = Form(...),
+    rag: bool = Form(True),
+    sob_demanda: bool = Form(ANALISE_SOB_DEMANDA),
+):
+    """
+    Versão em streaming (NDJSON) do /analyze-pdf/. Primeiro envia um evento "grupos" com as
+    interpretações do glossário e depois um evento "analise" para cada análise de IA, na
+    ordem em que ficam prontas, terminando com um evento "fim".
+    """
+    try:
+        upload = await receber_upload(file)
+        try:
+            structured_data = await extrair_dados(upload)
+        finally:
+            upload.fechar()
+        analyzed_groups = interpretar_grupos(structured_data, idade, sexo)
+    except (LimitePdfExcedido, UploadMuitoGrande) as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except DocumentoRejeitado as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except LLMIndisponivel as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "10"})
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Ocorreu um erro inesperado no servidor: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Ocorreu um erro inesperado no servidor: {str(e)}")
+
+    alterados = list(resultados_alterados(analyzed_groups))
+    if sob_demanda:
+        preparar_analises_sob_demanda([result for _, _, result in alterados], idade, sexo, rag)
+        alterados = []
+
+    async def eventos():
+        yield _evento({
+            "tipo": "grupos",
+            "filename": file.filename,
+            "groups": analyzed_groups,
+            "rag_mode_used": rag,
+            "analise_sob_demanda": sob_demanda,
+            "analises_pendentes": len(alterados),
+        })
+
+        semaforo_requisicao = asyncio.Semaphore(ANALISE_CONCORRENCIA_REQUISICAO)
+
+        async def analisar(group_index, result_index, result):
+            analise_ia = await gerar_analise_limitada(
+                result["exame"], result["valor"], result["status_class"], result["interpretacao"], idade, sexo, rag, semaforo_requisicao,
+            )
+            return group_index, result_index, analise_ia
+
+        tarefas = [asyncio.create_task(analisar(*item)) for item in alterados]
+        try:
+            with medir("analises"):
+                for tarefa in asyncio.as_completed(tarefas):
+                    group_index, result_index, analise_ia = await tarefa
+                    yield _evento({"tipo": "analise", "group_index": group_index, "result_index": result_index, "analise_ia": analise_ia})
+            yield _evento({"tipo": "fim"})
+        except Exception as e:
+            yield _evento({"tipo": "erro", "detail": f"Ocorreu um erro inesperado no servidor: {str(e)}"})
+        finally:
+            # Se o cliente desconectar, as análises que faltam são canceladas
+            for tarefa in tarefas:
+                tarefa.cancel()
+
+    return StreamingResponse(eventos(), media_type="application/x-ndjson")
+
+@app.get("/analysis/{analise_id}/")
+async def analysis(analise_id: str):
+    """Gera (ou devolve do cache) a análise de IA de um resultado recebido no modo sob demanda."""
+    pedido = buscar_pedido_analise(analise_id)
+    if pedido is None:
+        raise HTTPException(status_code=404, detail="Análise não encontrada ou expirada. Envie o exame novamente.")
+    with medir("analise_sob_demanda"):
+        analise_ia = await gerar_analise_limitada(
+            pedido["term"], pedido["value"], pedido["status"], pedido["interpretation"],
+            pedido["idade"], pedido["sexo"], pedido["rag"], asyncio.Semaphore(1),
+        )
+    return {"analise_id": analise_id, "analise_ia": analise_ia}
+
+def _evento(dados: dict) -> str:
+    return json.dumps(dados, ensure_ascii=False) + "\n"
+
+# Com gunicorn --preload, aquecer antes do fork deixa o glossário compilado compartilhado entre os workers
+if os.getenv("MEDBOT_PRECARREGAR", "0") == "1":
+    aquecer()
@@ -0,0 +1,10 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Os testes importam os módulos como o app faz (`from utils...`), a partir de backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Caches em disco numa pasta temporária, para não misturar com os do servidor
+os.environ.setdefault("MEDBOT_CACHE_DIR", tempfile.mkdtemp(prefix="medbot-testes-"))
@@ -0,0 +1,80 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import app
+from utils import llm_client
+
+
+class BackendFalso(llm_client.BackendLLM):
+    """Responde ao prompt em lote e ao individual, anotando o tipo de cada chamada."""
+
+    def __init__(self):
+        self.chamadas = []
+
+    async def completar(self, model, messages, temperature, response_format):
+        prompt = messages[-1]["content"]
+        em_lote = "**Exames (JSON):**" in prompt
+        self.chamadas.append("lote" if em_lote else "individual")
+        await asyncio.sleep(0.05)
+        if em_lote:
+            inicio = prompt.index("**Exames (JSON):**") + len("**Exames (JSON):**")
+            exames, _ = json.JSONDecoder().raw_decode(prompt[inicio:].lstrip())
+            return json.dumps({"analises": [{"id": e["id"], "titulo": f"Lote {e['termo']}", "analise": "a"} for e in exames]})
+        return json.dumps({"titulo": "Individual", "analise": "a"})
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    falso = BackendFalso()
+    llm_client.definir_backend(falso)
+
+    async def extrair(upload):
+        return {"grupos": [{"grupo": "Bioquímica", "resultados": [
+            {"exame": "Colesterol Total", "valor": "211", "unidade": "mg/dL"},
+            {"exame": "Vitamina D", "valor": "15,5", "unidade": "ng/mL"},
+            {"exame": "Triglicerídeos", "valor": "320", "unidade": "mg/dL"},
+        ]}]}
+
+    monkeypatch.setattr(app, "extrair_dados", extrair)
+    monkeypatch.setattr(app, "ANALISE_PREFETCH", 3)
+    monkeypatch.setattr(app, "ANALISE_EM_LOTE", True)
+    yield falso
+    llm_client.definir_backend(None)
+
+
+async def _analisar(cliente, idade):
+    resposta = await cliente.post(
+        "/analyze-pdf/", files={"file": ("a.pdf", b"%PDF-1.4", "application/pdf")},
+        data={"idade": str(idade), "sexo": "Masculino", "sob_demanda": "true"},
+    )
+    assert resposta.status_code == 200
+    return [r["analise_id"] for g in resposta.json()["groups"] for r in g["results"] if r.get("analise_id")]
+
+
+def test_analise_do_prefetch_e_servida_pelo_endpoint(backend):
+    async def cenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://teste") as cliente:
+            ids = await _analisar(cliente, 41)
+            assert len(ids) == 3
+            await asyncio.gather(*app._tarefas_prefetch)
+            respostas = [(await cliente.get(f"/analysis/{i}/")).json() for i in ids]
+        return respostas
+
+    respostas = asyncio.run(cenario())
+    assert backend.chamadas == ["lote"]
+    assert all(r["analise_ia"]["titulo"].startswith("Lote") for r in respostas)
+
+
+def test_analise_pedida_durante_o_prefetch_espera_pelo_lote(backend):
+    async def cenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://teste") as cliente:
+            ids = await _analisar(cliente, 42)
+            # O lote ainda está em andamento: os cards abertos agora esperam por ele
+            return await asyncio.gather(*(cliente.get(f"/analysis/{i}/") for i in ids))
+
+    respostas = asyncio.run(cenario())
+    assert backend.chamadas == ["lote"]
+    assert all(r.json()["analise_ia"]["titulo"].startswith("Lote") for r in respostas)
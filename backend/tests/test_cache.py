@@ -0,0 +1,19 @@
+from utils import cache
+
+
+def test_limite_do_disco_aplicado_a_cada_n_gravacoes(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_LIMPEZA_A_CADA", 10)
+    c = cache.CacheHibrido("teste", max_memoria=0, max_disco=20, caminho=tmp_path / "c.sqlite3")
+    for i in range(55):
+        c.set(f"k{i}", i)
+    linhas = c._conectar().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+    assert 20 <= linhas < 20 + 10
+    # As mais recentes ficam; as menos usadas saem primeiro
+    assert c.get("k54") == 54
+    assert c.get("k0") is None
+
+
+def test_item_expirado_nao_e_servido_antes_da_limpeza(tmp_path):
+    c = cache.CacheHibrido("teste", max_memoria=0, ttl_segundos=0, caminho=tmp_path / "c.sqlite3")
+    c.set("k", 1)
+    assert c.get("k") is None
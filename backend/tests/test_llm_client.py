@@ -0,0 +1,12 @@
+import pytest
+
+from utils.llm_client import BackendLLM
+
+
+def test_backend_incompleto_falha_ao_ser_criado():
+    class SemCompletar(BackendLLM):
+        async def fechar(self):
+            pass
+
+    with pytest.raises(TypeError):
+        SemCompletar()
@@ -0,0 +1,65 @@
+from utils.data_extractor import obter_indice_termos
+from utils.local_parser import extrair_localmente, mesclar_grupos
+
+
+def _extrair(texto):
+    grupos, pendencias = extrair_localmente(texto, obter_indice_termos())
+    resultados = {(g["grupo"], r["exame"]): r["valor"] for g in grupos for r in g["resultados"]}
+    return resultados, [linha for _, linha in pendencias]
+
+
+def test_rotulos_que_so_terminam_com_um_termo_vao_para_a_ia():
+    resultados, pendencias = _extrair(
+        "BIOQUIMICA\n"
+        "Volume médio de plaquetas: 10,2 fL\n"
+        "1,25 Dihidroxi vitamina D: 40 pg/mL\n"
+        "Anticorpo anti-receptor de TSH: 1,2 UI/L\n"
+        "Clearance de creatinina: 98 mL/min\n"
+        "Relação Albumina/Creatinina: 12 mg/g\n"
+        "Creatinina: 0,9 mg/dL\n"
+    )
+    assert resultados == {("Bioquimica", "creatinina"): "0,9"}
+    assert len(pendencias) == 5
+
+
+def test_volume_de_plaquetas_nao_toma_o_lugar_da_contagem():
+    resultados, pendencias = _extrair(
+        "PLAQUETOGRAMA\nVolume médio de plaquetas: 10,2 fL\nContagem de Plaquetas: 250.000 /mm³\n"
+    )
+    assert resultados == {("Plaquetograma", "plaquetas"): "250.000"}
+    assert pendencias == ["Volume médio de plaquetas: 10,2 fL"]
+
+
+def test_mesmo_exame_em_secoes_diferentes():
+    resultados, pendencias = _extrair(
+        "URINA TIPO I\nHemoglobina: 0,03 mg/dL\nLeucócitos: 5000 /mL\n"
+        "HEMOGRAMA\nHemoglobina: 13,5 g/dL\nLeucócitos: 6.010 /mm³\n"
+    )
+    assert resultados == {
+        ("Urina Tipo I", "hemoglobina"): "0,03",
+        ("Urina Tipo I", "leucocitos"): "5000",
+        ("Hemograma", "hemoglobina"): "13,5",
+        ("Hemograma", "leucocitos"): "6.010",
+    }
+    assert pendencias == []
+
+
+def test_valores_diferentes_na_mesma_secao_vao_para_a_ia():
+    resultados, pendencias = _extrair("HEMOGRAMA\nHemoglobina: 13,5 g/dL\nHemacias: 4,5 milhões/mm³\nHemoglobina: 11,0 g/dL\n")
+    assert resultados == {("Hemograma", "hemacias"): "4,5"}
+    assert pendencias == ["Hemoglobina: 13,5 g/dL", "Hemoglobina: 11,0 g/dL"]
+
+
+def test_linha_repetida_com_o_mesmo_valor_fica_uma_vez():
+    resultados, pendencias = _extrair("HEMOGRAMA\nHemoglobina: 13,5 g/dL\nHemoglobina: 13,5 g/dL\n")
+    assert resultados == {("Hemograma", "hemoglobina"): "13,5"}
+    assert pendencias == []
+
+
+def test_mesclar_grupos_mantem_o_mesmo_exame_em_grupos_diferentes():
+    urina = {"grupo": "Urina Tipo I", "resultados": [{"exame": "hemoglobina", "valor": "0,03", "unidade": "mg/dL"}]}
+    hemograma = {"grupo": "Hemograma", "resultados": [{"exame": "hemoglobina", "valor": "13,5", "unidade": "g/dL"}]}
+    repetido = {"grupo": "HEMOGRAMA", "resultados": [{"exame": "Hemoglobina", "valor": "13,5", "unidade": "g/dL"}]}
+    for base, extra in (([urina], [hemograma, repetido]), ([hemograma], [repetido, urina])):
+        mesclados = mesclar_grupos(base, extra)
+        assert sorted((g["grupo"], len(g["resultados"])) for g in mesclados) == [("Hemograma", 1), ("Urina Tipo I", 1)]
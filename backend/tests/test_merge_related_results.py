@@ -0,0 +1,81 @@
+import random
+
+import pytest
+
+from app import merge_related_results
+
+
+def merge_related_results_original(results):
+    """Implementação anterior à indexação (comparação de todos os pares), usada como oráculo."""
+    merged_results = []
+    processed_indices = set()
+    for i, current_result in enumerate(results):
+        if i in processed_indices: continue
+        base_name = current_result.get("exame", "")
+        if not base_name: continue
+        related_indices = [i]
+        for j, other_result in enumerate(results):
+            other_exam_name = other_result.get("exame", "")
+            if not other_exam_name: continue
+            if i != j and j not in processed_indices and (base_name in other_exam_name or other_exam_name in base_name):
+                related_indices.append(j)
+        if len(related_indices) > 1:
+            valid_results = [results[k] for k in related_indices if "valor" in results[k] and "unidade" in results[k]]
+            if not valid_results: continue
+            combined_valor = " / ".join([r.get("valor", "") for r in valid_results])
+            combined_unidade = " / ".join([r.get("unidade", "") for r in valid_results])
+            base_exam_name = min([r.get("exame", "") for r in valid_results], key=len)
+            merged_results.append({"exame": base_exam_name, "valor": combined_valor, "unidade": combined_unidade})
+            processed_indices.update(related_indices)
+        else:
+            merged_results.append(current_result)
+            processed_indices.add(i)
+    return merged_results
+
+
+# Chaves do glossário que contêm umas às outras, nomes fora do glossário e nomes vazios
+NOMES = [
+    "hemoglobina", "hemoglobina glicada", "hemoglobina glicada (hba1c)", "hba1c",
+    "h.c.m", "h.c.m.", "c.h.c.m", "c.h.c.m.", "hcm", "chcm", "v.c.m", "vcm",
+    "colesterol total", "colesterol hdl", "colesterol não hdl", "colesterol ldl", "colesterol vldl",
+    "tsh", "tsh - hormonio tireoestimulante", "t4 l", "t4 l - tiroxina livre", "tiroxina livre",
+    "vitamina d", "vitamina d (25 hidroxi)", "ast", "alt", "tgo", "tgp", "ferritina",
+    "Glicose", "Glicose em jejum", "hdl", "ldl", "Colesterol", "Sódio", "Sódio sérico", "d", "",
+]
+
+
+def gerar_resultados(aleatorio: random.Random) -> list[dict]:
+    resultados = []
+    for _ in range(aleatorio.randint(0, 12)):
+        resultado = {}
+        if aleatorio.random() > 0.05:
+            resultado["exame"] = aleatorio.choice(NOMES)
+        if aleatorio.random() > 0.1:
+            resultado["valor"] = str(aleatorio.choice([1, 4.5, "12,1", "84", "1.200", ""]))
+        if aleatorio.random() > 0.1:
+            resultado["unidade"] = aleatorio.choice(["g/dL", "mg/dL", "%", "pg", ""])
+        resultados.append(resultado)
+        # Duplicatas exatas do mesmo exame
+        if resultados and aleatorio.random() < 0.15:
+            resultados.append(dict(aleatorio.choice(resultados)))
+    return resultados
+
+
+@pytest.mark.parametrize("semente", range(30))
+def test_equivalente_a_implementacao_original(semente):
+    aleatorio = random.Random(semente)
+    for _ in range(1000):
+        resultados = gerar_resultados(aleatorio)
+        assert merge_related_results(resultados) == merge_related_results_original(resultados), resultados
+
+
+@pytest.mark.parametrize("resultados", [
+    [],
+    [{"exame": ""}],
+    [{"exame": "hcm", "valor": "30"}, {"exame": "chcm", "valor": "33", "unidade": "g/dL"}],
+    [{"exame": "hcm"}, {"exame": "chcm"}],
+    [{"exame": "Glicose", "valor": "90", "unidade": "mg/dL"}, {"exame": "Glicose em jejum", "valor": "92", "unidade": "mg/dL"}],
+    [{"exame": "tsh", "valor": "2", "unidade": "mUI/L"}] * 3,
+])
+def test_casos_de_borda(resultados):
+    assert merge_related_results(resultados) == merge_related_results_original(resultados)
@@ -0,0 +1,59 @@
+import asyncio
+import time
+from pathlib import Path
+
+import pytest
+
+from utils import pdf_reader
+
+PDF_EXEMPLO = Path(__file__).resolve().parents[2] / "testing" / "pdfs" / "exame-bia.pdf"
+
+
+def _presa_numa_pagina(*args):
+    time.sleep(30)
+
+
+def _falha(*args):
+    raise ValueError("PDF inválido")
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(pdf_reader, "PDF_FOLGA_SEGUNDOS", 0.2)
+    pool = pdf_reader.PoolDeLeitura(2)
+    yield pool
+    pool.encerrar()
+
+
+def test_extracao_no_pool_igual_a_leitura_direta(monkeypatch):
+    esperado = pdf_reader.extrair_paginas(PDF_EXEMPLO, 0, pdf_reader.contar_paginas(PDF_EXEMPLO))
+    try:
+        assert asyncio.run(pdf_reader.extrair_texto_pdf(PDF_EXEMPLO)) == esperado
+        assert asyncio.run(pdf_reader.extrair_texto_pdf(PDF_EXEMPLO.read_bytes())) == esperado
+    finally:
+        pdf_reader.encerrar_pool()
+
+
+def test_tarefa_presa_encerra_so_o_proprio_processo(pool):
+    async def cenario():
+        prazo = time.time() + 0.3
+        presa = asyncio.ensure_future(pool.executar(_presa_numa_pagina, prazo=prazo))
+        # A leitura de outro PDF, no segundo processo, não é afetada
+        paginas = await pool.executar(pdf_reader.contar_paginas, PDF_EXEMPLO, prazo=time.time() + 30)
+        inicio = time.perf_counter()
+        with pytest.raises(pdf_reader.LimitePdfExcedido):
+            await presa
+        return paginas, time.perf_counter() - inicio
+
+    paginas, espera = asyncio.run(cenario())
+    assert paginas > 0
+    assert espera < 5
+    assert pool.reciclados == 1
+    # O processo encerrado é substituído na próxima tarefa
+    assert asyncio.run(pool.executar(pdf_reader.contar_paginas, PDF_EXEMPLO, prazo=time.time() + 30)) == paginas
+
+
+def test_erro_da_tarefa_chega_a_quem_chamou(pool):
+    with pytest.raises(ValueError, match="PDF inválido"):
+        asyncio.run(pool.executar(_falha, prazo=time.time() + 30))
+    assert pool.reciclados == 0
@@ -0,0 +1,44 @@
+import pytest
+
+from utils import resolvedor_termos
+from utils.glossario import obter_glossario
+
+RESOLVIDOS = {
+    "Creatinina sérica": "creatinina",
+    "T4 Livre": "t4 l - tiroxina livre",
+    "Triglicérides": "triglicerideos",
+    "Eritrócitos": "hemacias",
+    "Glicose em jejum": "glicemia de jejum",
+    "Colesterol LDL calculado": "colesterol ldl",
+    "Vitamina D": "vitamina d",
+    "Vitamina D 25 hidroxi": "vitamina d (25 hidroxi)",
+    "Vitamina B12": "vitamina b12",
+    "Fibrose FIB-4": "fibrosis-4 (fib-4)",
+}
+
+# Nomes parecidos com uma entrada do glossário, mas de outro exame
+SEM_RESOLUCAO = ["Vitamina A", "Vitamina C", "Vitamina E", "Vitamina B1", "Vitamina D 1,25 dihidroxi"]
+
+
+@pytest.fixture(params=["numpy", "sem_numpy"])
+def resolvedor(request, monkeypatch):
+    if request.param == "sem_numpy":
+        monkeypatch.setattr(resolvedor_termos, "np", None)
+    elif resolvedor_termos.np is None:
+        pytest.skip("NumPy não instalado")
+    return resolvedor_termos.ResolvedorTermos(obter_glossario())
+
+
+@pytest.mark.parametrize("nome, chave", RESOLVIDOS.items())
+def test_resolve_nomes_fora_do_glossario(resolvedor, nome, chave):
+    assert resolvedor.resolver(nome) == chave
+
+
+@pytest.mark.parametrize("nome", SEM_RESOLUCAO)
+def test_palavras_distintivas_diferentes_nao_resolvem(resolvedor, nome):
+    assert resolvedor.resolver(nome) is None
+
+
+def test_lote_igual_a_consultas_individuais(resolvedor):
+    nomes = [*RESOLVIDOS, *SEM_RESOLUCAO]
+    assert resolvedor.resolver_lote(nomes) == [resolvedor_termos.ResolvedorTermos(obter_glossario()).resolver(n) for n in nomes]
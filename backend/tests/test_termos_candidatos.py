@@ -0,0 +1,19 @@
+from utils.data_extractor import obter_indice_termos
+
+
+def test_sinonimos_das_descricoes_entram_nos_candidatos():
+    candidatos = obter_indice_termos().termos_candidatos(
+        "Hemoglobina: 13,5 g/dL\nEritrócitos: 4,5 milhões/mm³\nNeutrófilos: 60 %"
+    )
+    assert candidatos is not None
+    assert {"hemoglobina", "hemacias", "segmentados"} <= set(candidatos)
+
+
+def test_linha_sem_candidato_usa_o_glossario_inteiro():
+    texto = "Hemoglobina: 13,5 g/dL\nGlicose: 90 mg/dL"
+    assert obter_indice_termos().termos_candidatos(texto) is None
+
+
+def test_linhas_que_nao_sao_resultados_nao_desativam_a_poda():
+    texto = "HEMOGRAMA\nHemoglobina: 13,5 g/dL\nValores de referência: 12,0 a 15,8 g/dL\nData da coleta: 12/03/2024"
+    assert obter_indice_termos().termos_candidatos(texto) is not None
@@ -1,14 +1,57 @@
 import os
 import json
-from openai import AsyncOpenAI
-from dotenv import load_dotenv
 
-load_dotenv()
+import asyncio
+import secrets
 
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("A variável de ambiente OPENAI_API_KEY não foi encontrada.")
-client = AsyncOpenAI(api_key=api_key)
+from utils.cache import CacheHibrido, VooUnico, gerar_chave, hash_texto
+from utils.llm_client import completar
+
+# Cache das análises: o texto gerado cita o valor e a idade do paciente, então só o mesmo achado
+# (termo, valor, status, idade, sexo e interpretação base) reaproveita uma análise
+_cache_analises = CacheHibrido(
+    "analises",
+    max_memoria=int(os.getenv("MEDBOT_CACHE_ANALISES_MAX_MEMORIA", "512")),
+    max_disco=int(os.getenv("MEDBOT_CACHE_ANALISES_MAX_DISCO", "20000")),
+    ttl_segundos=float(os.getenv("MEDBOT_CACHE_ANALISES_TTL", str(30 * 24 * 3600))),
+)
+
+# Pedidos simultâneos da mesma análise (mesma chave de cache) esperam por uma única chamada ao modelo
+_voo_analises = VooUnico("analises")
+
+def chave_analise(term: str, value: str, status: str, rag: bool, idade: int, sexo: str, template: str, interpretation: str = "") -> str:
+    """
+    Chave de cache de uma análise, versionada pelo hash do template do prompt. Inclui tudo o
+    que o prompt envia ao modelo: uma análise nunca é servida a um paciente com outro valor ou idade.
+    """
+    return gerar_chave(
+        "analise", term.lower().strip(), " ".join(str(value).split()), status, "rag" if rag else "sem_rag",
+        sexo.lower().strip(), idade, hash_texto(interpretation) if rag else "", hash_texto(template),
+    )
+
+# Pedidos de análise sob demanda: o /analyze-pdf/ devolve só um identificador opaco por resultado
+# alterado e guarda aqui os dados do achado; a análise é gerada quando o card é aberto
+_pedidos_analise = CacheHibrido(
+    "pedidos_analise",
+    max_memoria=int(os.getenv("MEDBOT_ANALISE_PEDIDOS_MAX_MEMORIA", "2048")),
+    max_disco=int(os.getenv("MEDBOT_ANALISE_PEDIDOS_MAX_DISCO", "50000")),
+    ttl_segundos=float(os.getenv("MEDBOT_ANALISE_PEDIDOS_TTL", str(24 * 3600))),
+)
+
+def registrar_pedido_analise(term: str, value: str, status: str, interpretation: str, idade: int, sexo: str, rag: bool) -> str:
+    """Guarda os dados de um achado e devolve o identificador usado para pedir a análise depois."""
+    analise_id = secrets.token_urlsafe(16)
+    _pedidos_analise.set(analise_id, {
+        "term": term, "value": value, "status": status, "interpretation": interpretation,
+        "idade": idade, "sexo": sexo, "rag": rag,
+    })
+    return analise_id
+
+def buscar_pedido_analise(analise_id: str) -> dict | None:
+    return _pedidos_analise.get(analise_id)
+
+def estatisticas_cache_analises() -> dict:
+    return {**_cache_analises.estatisticas(), "coalescencia": _voo_analises.estatisticas()}
 
 # Versão 1: Prompt que USA o glossário (RAG)
 RAG_PROMPT_TEMPLATE = """
@@ -32,13 +75,37 @@ Você é Med-Bot, um assistente médico que analisa um resultado de exame altera
 Gere o JSON.
 """
 
+def chave_analise_lote(term: str, value: str, status: str, rag: bool, idade: int, sexo: str, interpretation: str = "") -> str:
+    """Chave com que o lote grava a análise, versionada pelo prompt em lote do modo usado."""
+    template = BATCH_PROMPT_TEMPLATE + (FONTE_RAG if rag else FONTE_NO_RAG)
+    return chave_analise(term, value, status, rag, idade, sexo, template, interpretation)
+
+async def _analise_pronta(chave: str, chave_lote: str) -> dict | None:
+    """
+    Análise já gerada para o item: no cache, individual ou de um lote (ex: o prefetch do modo
+    sob demanda), ou de um lote em andamento que o inclui. None quando é preciso gerar.
+    """
+    analise = _cache_analises.get(chave) or _cache_analises.get(chave_lote)
+    if analise is not None:
+        return analise
+    futuro = _voo_analises.em_andamento(chave_lote)
+    # O lote conclui com None os itens que faltaram na resposta: esses são gerados individualmente
+    return await asyncio.shield(futuro) if futuro is not None else None
+
 async def generate_ai_analysis_rag(term: str, value: str, status: str, interpretation: str, idade: int, sexo: str) -> dict:
     """Gera uma análise com IA usando o glossário (RAG)."""
+    chave = chave_analise(term, value, status, True, idade, sexo, RAG_PROMPT_TEMPLATE, interpretation)
+    analise = await _analise_pronta(chave, chave_analise_lote(term, value, status, True, idade, sexo, interpretation))
+    if analise is not None:
+        return analise
+    return await _voo_analises.executar(chave, lambda: _gerar_analise_rag(chave, term, value, status, interpretation, idade, sexo))
+
+async def _gerar_analise_rag(chave: str, term: str, value: str, status: str, interpretation: str, idade: int, sexo: str) -> dict:
     prompt = RAG_PROMPT_TEMPLATE.format(
         term=term, value=value, status=status, interpretation=interpretation, idade=idade, sexo=sexo
     )
     try:
-        resp = await client.chat.completions.create(
+        content = await completar(
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "Você cria análises em JSON baseadas estritamente no contexto fornecido."},
@@ -46,8 +113,11 @@ async def generate_ai_analysis_rag(term: str, value: str, status: str, interpret
             ],
             temperature=0.3,
             response_format={"type": "json_object"},
+            tipo="analise_rag",
         )
-        return json.loads(resp.choices[0].message.content)
+        analise = json.loads(content)
+        _cache_analises.set(chave, analise)
+        return analise
     except Exception as e:
         return {"titulo": "Erro na Análise RAG", "analise": str(e), "recomendacao": "", "alerta": ""}
 
@@ -74,11 +144,18 @@ Gere o JSON.
 
 async def generate_ai_analysis_no_rag(term: str, value: str, status: str, idade: int, sexo: str) -> dict:
     """Gera uma análise com IA sem usar o glossário."""
+    chave = chave_analise(term, value, status, False, idade, sexo, NO_RAG_PROMPT_TEMPLATE)
+    analise = await _analise_pronta(chave, chave_analise_lote(term, value, status, False, idade, sexo))
+    if analise is not None:
+        return analise
+    return await _voo_analises.executar(chave, lambda: _gerar_analise_no_rag(chave, term, value, status, idade, sexo))
+
+async def _gerar_analise_no_rag(chave: str, term: str, value: str, status: str, idade: int, sexo: str) -> dict:
     prompt = NO_RAG_PROMPT_TEMPLATE.format(
         term=term, value=value, status=status, idade=idade, sexo=sexo
     )
     try:
-        resp = await client.chat.completions.create(
+        content = await completar(
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "Você cria análises em JSON usando seu conhecimento médico geral."},
@@ -86,8 +163,138 @@ async def generate_ai_analysis_no_rag(term: str, value: str, status: str, idade:
             ],
             temperature=0.5,
             response_format={"type": "json_object"},
+            tipo="analise_sem_rag",
         )
-        return json.loads(resp.choices[0].message.content)
+        analise = json.loads(content)
+        _cache_analises.set(chave, analise)
+        return analise
     except Exception as e:
         return {"titulo": "Erro na Análise Sem RAG", "analise": str(e), "recomendacao": "", "alerta": ""}
 
+
+# Versão em lote: todos os resultados alterados de um laudo numa única requisição
+BATCH_PROMPT_TEMPLATE = """
+Você é Med-Bot, um assistente médico que analisa VÁRIOS resultados de exame alterados de um mesmo paciente, {fonte}.
+
+**Tarefa:** Para CADA exame da lista abaixo, crie uma análise personalizada para o paciente, em JSON.
+
+Cada análise deve ter:
+- `id`: o mesmo `id` do exame na lista.
+- `titulo`: Crie um título curto. Ex: "Hemácias Abaixo do Normal".
+- `analise`: Usando seu conhecimento, explique o que o valor do exame pode indicar, considerando a idade, o sexo do paciente e o status do resultado.  **Use markdown para negrito (`**palavra**`)** e listas. Comece com um emoji informativo (ex: 🩺, 🩸, 🔬). **NÃO use saudações.**
+- `recomendacao`: Sugira qual especialista procurar (ex: Hematologista) e o que fazer. Comece com um emoji de ação (ex: 🧑‍⚕️, 🗓️). Use negrito.
+- `alerta`: Uma frase curta enfatizando que isso não é um diagnóstico. Comece com um emoji de alerta (ex: ⚠️).
+
+**Paciente:**
+- **Idade:** "{idade}"
+- **Sexo:** "{sexo}"
+
+**Exames (JSON):**
+{exames}
+
+Responda com um único objeto JSON no formato {{"analises": [{{"id": 0, "titulo": "...", "analise": "...", "recomendacao": "...", "alerta": "..."}}]}}, com exatamente uma análise por exame.
+"""
+
+FONTE_RAG = "**usando a 'interpretacao_base' de cada exame como fonte principal de verdade**"
+FONTE_NO_RAG = "**usando seu conhecimento médico geral**"
+
+def _validar_analise(item) -> dict | None:
+    """Confere se um item da resposta em lote tem os campos esperados."""
+    if not isinstance(item, dict):
+        return None
+    if not isinstance(item.get("titulo"), str) or not isinstance(item.get("analise"), str):
+        return None
+    if not item["titulo"].strip() or not item["analise"].strip():
+        return None
+    return {
+        "titulo": item["titulo"],
+        "analise": item["analise"],
+        "recomendacao": item.get("recomendacao") if isinstance(item.get("recomendacao"), str) else "",
+        "alerta": item.get("alerta") if isinstance(item.get("alerta"), str) else "",
+    }
+
+async def generate_ai_analyses_batch(itens: list[dict], idade: int, sexo: str, rag: bool) -> list[dict | None]:
+    """
+    Gera as análises de vários resultados alterados numa única chamada ao modelo.
+
+    Cada item tem `term`, `value`, `status` e, no modo RAG, `interpretation`. A lista devolvida
+    segue a ordem dos itens; posições None são itens que faltaram ou vieram inválidos na
+    resposta e devem ser gerados individualmente por quem chamou.
+    """
+    # O lote grava com a versão do próprio prompt; as análises individuais (versionadas pelo
+    # template de cada modo) também servem, mas não são sobrescritas pelo lote
+    template_individual = RAG_PROMPT_TEMPLATE if rag else NO_RAG_PROMPT_TEMPLATE
+    chaves = [
+        chave_analise_lote(item["term"], item["value"], item["status"], rag, idade, sexo, item.get("interpretation", ""))
+        for item in itens
+    ]
+    chaves_individuais = [
+        chave_analise(item["term"], item["value"], item["status"], rag, idade, sexo, template_individual, item.get("interpretation", ""))
+        for item in itens
+    ]
+    analises = [_cache_analises.get(chave) or _cache_analises.get(individual) for chave, individual in zip(chaves, chaves_individuais)]
+
+    pendentes = [i for i, analise in enumerate(analises) if analise is None]
+    if not pendentes:
+        return analises
+
+    # Itens que outra requisição já está gerando não entram no lote: esperam pelo mesmo resultado
+    em_voo = {
+        i: futuro for i in pendentes
+        if (futuro := _voo_analises.em_andamento(chaves[i]) or _voo_analises.em_andamento(chaves_individuais[i])) is not None
+    }
+    pendentes = [i for i in pendentes if i not in em_voo]
+    reservas = {i: _voo_analises.reservar(chaves[i]) for i in pendentes}
+    try:
+        if pendentes:
+            await _gerar_lote(itens, chaves, analises, pendentes, idade, sexo, rag)
+    finally:
+        for i, futuro in reservas.items():
+            _voo_analises.concluir(futuro, analises[i])
+
+    if em_voo:
+        esperadas = await asyncio.gather(*(asyncio.shield(futuro) for futuro in em_voo.values()), return_exceptions=True)
+        for i, analise in zip(em_voo, esperadas):
+            analises[i] = analise if isinstance(analise, dict) else None
+    return analises
+
+async def _gerar_lote(itens: list[dict], chaves: list[str], analises: list, pendentes: list[int], idade: int, sexo: str, rag: bool) -> None:
+    """Faz a chamada em lote para os itens pendentes e preenche `analises` com as respostas válidas."""
+    exames = []
+    for i in pendentes:
+        exame = {"id": i, "termo": itens[i]["term"], "resultado": itens[i]["value"], "status": itens[i]["status"]}
+        if rag:
+            exame["interpretacao_base"] = itens[i].get("interpretation", "")
+        exames.append(exame)
+
+    prompt = BATCH_PROMPT_TEMPLATE.format(
+        fonte=FONTE_RAG if rag else FONTE_NO_RAG,
+        idade=idade,
+        sexo=sexo,
+        exames=json.dumps(exames, ensure_ascii=False, indent=2),
+    )
+    try:
+        content = await completar(
+            model="gpt-4o",
+            messages=[
+                {"role": "system", "content": "Você cria análises em JSON baseadas estritamente no contexto fornecido." if rag else "Você cria análises em JSON usando seu conhecimento médico geral."},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.3 if rag else 0.5,
+            response_format={"type": "json_object"},
+            tipo="analise_lote_rag" if rag else "analise_lote_sem_rag",
+        )
+        respostas = json.loads(content).get("analises", [])
+    except Exception as e:
+        print(f"Erro na análise em lote: {e}")
+        return
+
+    if not isinstance(respostas, list):
+        return
+    for item in respostas:
+        if not isinstance(item, dict) or not isinstance(item.get("id"), int) or item["id"] not in pendentes or analises[item["id"]] is not None:
+            continue
+        analise = _validar_analise(item)
+        if analise:
+            analises[item["id"]] = analise
+            _cache_analises.set(chaves[item["id"]], analise)
@@ -0,0 +1,248 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from utils.metricas import registrar_coletor
+
+# Diretório compartilhado pelos caches em disco (pode ser sobrescrito por variável de ambiente)
+CACHE_DIR = Path(os.getenv("MEDBOT_CACHE_DIR", Path(__file__).resolve().parent.parent / ".cache"))
+
+# A expiração e o limite de itens em disco são aplicados a cada N gravações, não em todas:
+# entre duas limpezas o disco pode passar do limite em até N-1 itens
+CACHE_LIMPEZA_A_CADA = max(1, int(os.getenv("MEDBOT_CACHE_LIMPEZA_A_CADA", "100")))
+
+# Coalescência das chamadas idênticas simultâneas (0 desliga: útil para medir o pipeline inteiro
+# com requisições repetidas, como no benchmark)
+COALESCENCIA_ATIVA = os.getenv("MEDBOT_COALESCENCIA", "1") == "1"
+
+# Todos os caches e grupos de voo único criados no processo, para o /metrics
+_caches: list["CacheHibrido"] = []
+_voos: list["VooUnico"] = []
+
+
+def gerar_chave(*partes) -> str:
+    """Gera uma chave SHA-256 estável a partir de qualquer combinação de valores serializáveis em JSON."""
+    bruto = json.dumps(partes, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(bruto.encode("utf-8")).hexdigest()
+
+
+def hash_texto(texto: str) -> str:
+    """Hash curto de um texto (ex: template de prompt), usado para versionar chaves de cache."""
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:16]
+
+
+class CacheHibrido:
+    """
+    Cache em dois níveis: um LRU em memória na frente de uma tabela SQLite em disco.
+    As entradas expiram após `ttl_segundos` e cada nível é limitado em número de itens.
+    """
+
+    def __init__(self, nome: str, max_memoria: int = 256, max_disco: int = 5000, ttl_segundos: float = 7 * 24 * 3600, caminho: Path | None = None):
+        self.nome = nome
+        self.max_memoria = max_memoria
+        self.max_disco = max_disco
+        self.ttl_segundos = ttl_segundos
+        self.caminho = Path(caminho) if caminho else CACHE_DIR / f"{nome}.sqlite3"
+
+        self._memoria: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._conexao = None
+        # Começa no limite: a primeira gravação do processo já faz a limpeza
+        self._gravacoes_sem_limpeza = CACHE_LIMPEZA_A_CADA
+
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+        _caches.append(self)
+
+    def _conectar(self) -> sqlite3.Connection:
+        # A conexão é aberta sob demanda para não criar arquivos durante o import
+        if self._conexao is None:
+            self.caminho.parent.mkdir(parents=True, exist_ok=True)
+            conexao = sqlite3.connect(self.caminho, timeout=5, check_same_thread=False)
+            conexao.execute("PRAGMA journal_mode=WAL")
+            # Com WAL, NORMAL não corrompe o banco; no pior caso (queda de energia) perde as
+            # últimas gravações, o que num cache é só uma nova chamada
+            conexao.execute("PRAGMA synchronous=NORMAL")
+            conexao.execute(
+                "CREATE TABLE IF NOT EXISTS cache (chave TEXT PRIMARY KEY, valor TEXT NOT NULL, criado_em REAL NOT NULL, acessado_em REAL NOT NULL)"
+            )
+            conexao.execute("CREATE INDEX IF NOT EXISTS idx_cache_acessado_em ON cache (acessado_em)")
+            conexao.execute("CREATE INDEX IF NOT EXISTS idx_cache_criado_em ON cache (criado_em)")
+            self._conexao = conexao
+        return self._conexao
+
+    def _guardar_em_memoria(self, chave: str, criado_em: float, valor) -> None:
+        self._memoria[chave] = (criado_em, valor)
+        self._memoria.move_to_end(chave)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def get(self, chave: str):
+        """Retorna o valor armazenado ou None se não existir ou estiver expirado."""
+        agora = time.time()
+        with self._lock:
+            item = self._memoria.get(chave)
+            if item is not None:
+                criado_em, valor = item
+                if agora - criado_em <= self.ttl_segundos:
+                    self._memoria.move_to_end(chave)
+                    self.hits_memoria += 1
+                    return valor
+                del self._memoria[chave]
+
+            try:
+                conexao = self._conectar()
+                linha = conexao.execute("SELECT valor, criado_em FROM cache WHERE chave = ?", (chave,)).fetchone()
+                if linha is not None:
+                    valor_json, criado_em = linha
+                    if agora - criado_em <= self.ttl_segundos:
+                        conexao.execute("UPDATE cache SET acessado_em = ? WHERE chave = ?", (agora, chave))
+                        conexao.commit()
+                        valor = json.loads(valor_json)
+                        self._guardar_em_memoria(chave, criado_em, valor)
+                        self.hits_disco += 1
+                        return valor
+                    conexao.execute("DELETE FROM cache WHERE chave = ?", (chave,))
+                    conexao.commit()
+            except sqlite3.Error as e:
+                print(f"Erro ao ler o cache '{self.nome}': {e}")
+
+            self.misses += 1
+            return None
+
+    def set(self, chave: str, valor) -> None:
+        """
+        Armazena o valor nos dois níveis. A cada CACHE_LIMPEZA_A_CADA gravações remove do disco
+        as entradas expiradas e as menos usadas além do limite.
+        """
+        agora = time.time()
+        with self._lock:
+            self._guardar_em_memoria(chave, agora, valor)
+            try:
+                conexao = self._conectar()
+                conexao.execute(
+                    "INSERT OR REPLACE INTO cache (chave, valor, criado_em, acessado_em) VALUES (?, ?, ?, ?)",
+                    (chave, json.dumps(valor, ensure_ascii=False), agora, agora),
+                )
+                self._gravacoes_sem_limpeza += 1
+                if self._gravacoes_sem_limpeza >= CACHE_LIMPEZA_A_CADA:
+                    self._gravacoes_sem_limpeza = 0
+                    conexao.execute("DELETE FROM cache WHERE criado_em < ?", (agora - self.ttl_segundos,))
+                    excedente = conexao.execute("SELECT COUNT(*) FROM cache").fetchone()[0] - self.max_disco
+                    if excedente > 0:
+                        conexao.execute(
+                            "DELETE FROM cache WHERE chave IN (SELECT chave FROM cache ORDER BY acessado_em ASC LIMIT ?)",
+                            (excedente,),
+                        )
+                conexao.commit()
+            except sqlite3.Error as e:
+                print(f"Erro ao gravar no cache '{self.nome}': {e}")
+
+    def limpar(self) -> None:
+        """Remove todas as entradas dos dois níveis."""
+        with self._lock:
+            self._memoria.clear()
+            try:
+                conexao = self._conectar()
+                conexao.execute("DELETE FROM cache")
+                conexao.commit()
+            except sqlite3.Error as e:
+                print(f"Erro ao limpar o cache '{self.nome}': {e}")
+
+    def estatisticas(self) -> dict:
+        """Contadores de acertos e falhas do cache."""
+        total = self.hits_memoria + self.hits_disco + self.misses
+        return {
+            "hits_memoria": self.hits_memoria,
+            "hits_disco": self.hits_disco,
+            "misses": self.misses,
+            "taxa_acerto": round((self.hits_memoria + self.hits_disco) / total, 4) if total else 0.0,
+            "itens_memoria": len(self._memoria),
+        }
+
+
+class VooUnico:
+    """
+    Coalescência de chamadas (single-flight): enquanto um trabalho com determinada chave está
+    em andamento, quem pedir a mesma chave espera pelo mesmo futuro em vez de repetir o trabalho.
+    Complementa o cache, que só ajuda depois que o primeiro resultado fica pronto.
+    """
+
+    def __init__(self, nome: str, ativo: bool = COALESCENCIA_ATIVA):
+        self.nome = nome
+        self.ativo = ativo
+        self._em_andamento: dict[str, asyncio.Future] = {}
+        self.executadas = 0
+        self.coalescidas = 0
+        _voos.append(self)
+
+    async def executar(self, chave: str, fabrica):
+        """Roda `fabrica()` (uma corrotina) uma única vez por chave entre as chamadas simultâneas."""
+        if not self.ativo:
+            self.executadas += 1
+            return await fabrica()
+        futuro = self._em_andamento.get(chave)
+        if futuro is not None:
+            self.coalescidas += 1
+        else:
+            futuro = asyncio.ensure_future(fabrica())
+            self._reservar(chave, futuro)
+            self.executadas += 1
+        # shield: se quem iniciou desistir (ex: cliente desconectou), os demais continuam esperando
+        return await asyncio.shield(futuro)
+
+    def em_andamento(self, chave: str) -> asyncio.Future | None:
+        """Futuro do trabalho em andamento para a chave, contado como chamada coalescida."""
+        futuro = self._em_andamento.get(chave) if self.ativo else None
+        if futuro is not None:
+            self.coalescidas += 1
+        return futuro
+
+    def reservar(self, chave: str) -> asyncio.Future:
+        """Registra um trabalho feito por fora (ex: um lote) para que outros esperem por ele; conclua com concluir()."""
+        futuro = asyncio.get_running_loop().create_future()
+        if self.ativo:
+            self._reservar(chave, futuro)
+        self.executadas += 1
+        return futuro
+
+    def concluir(self, futuro: asyncio.Future, valor) -> None:
+        if not futuro.done():
+            futuro.set_result(valor)
+
+    def _reservar(self, chave: str, futuro: asyncio.Future) -> None:
+        self._em_andamento[chave] = futuro
+
+        def _remover(concluido):
+            if self._em_andamento.get(chave) is concluido:
+                del self._em_andamento[chave]
+            # Marca a exceção como lida mesmo que todos os interessados tenham desistido
+            if not concluido.cancelled():
+                concluido.exception()
+
+        futuro.add_done_callback(_remover)
+
+    def estatisticas(self) -> dict:
+        return {"executadas": self.executadas, "coalescidas": self.coalescidas, "em_andamento": len(self._em_andamento)}
+
+
+def _coletar_metricas_caches():
+    estatisticas = [(cache.nome, cache.estatisticas()) for cache in _caches]
+    yield ("medbot_cache_acertos_total", "counter", "Acertos do cache por nível.", [
+        ({"cache": nome, "nivel": nivel}, e[f"hits_{nivel}"]) for nome, e in estatisticas for nivel in ("memoria", "disco")
+    ])
+    yield ("medbot_cache_falhas_total", "counter", "Consultas que não encontraram o item no cache.", [({"cache": nome}, e["misses"]) for nome, e in estatisticas])
+    yield ("medbot_cache_taxa_acerto", "gauge", "Fração das consultas atendidas pelo cache.", [({"cache": nome}, e["taxa_acerto"]) for nome, e in estatisticas])
+    yield ("medbot_cache_itens_memoria", "gauge", "Itens no LRU em memória.", [({"cache": nome}, e["itens_memoria"]) for nome, e in estatisticas])
+    yield ("medbot_coalescidas_total", "counter", "Chamadas que esperaram por um trabalho idêntico já em andamento.", [({"grupo": voo.nome}, voo.coalescidas) for voo in _voos])
+    yield ("medbot_coalescencia_executadas_total", "counter", "Trabalhos de fato executados pelos grupos de voo único.", [({"grupo": voo.nome}, voo.executadas) for voo in _voos])
+
+
+registrar_coletor(_coletar_metricas_caches)
@@ -1,26 +1,31 @@
 import os
 import json
 import re
-from pathlib import Path
-from openai import AsyncOpenAI
-from dotenv import load_dotenv
+import asyncio
+import threading
+from functools import cache, lru_cache
 
-load_dotenv()
+from utils.llm_client import completar, chave_configurada
+from utils.cache import CacheHibrido, gerar_chave, hash_texto
+from utils.local_parser import VERSAO_PARSER, IndiceTermos, extrair_localmente, mesclar_grupos, sinonimos_da_descricao, texto_das_pendencias
+from utils.pdf_reader import SEPARADOR_PAGINAS
+from utils.glossario import lista_termos, obter_glossario, versao_glossario
+from utils.metricas import registrar_coletor
 
-api_key = os.getenv("OPENAI_API_KEY")
-if not api_key:
-    raise ValueError("A variável de ambiente OPENAI_API_KEY não foi encontrada.")
-client = AsyncOpenAI(api_key=api_key)
+# Parser local: resolve as linhas tabulares sem IA e só manda as sobras para o gpt-4o
+PARSER_LOCAL_ATIVO = os.getenv("MEDBOT_PARSER_LOCAL", "1") == "1"
 
-# Carrega o glossário para guiar a IA
-GLOSSARIO_FILE = Path(__file__).resolve().parent.parent / "data" / "glossario.json"
-with open(GLOSSARIO_FILE, "r", encoding="utf-8") as f:
-    _glossario = json.load(f)
+# Textos longos são divididos em blocos (por página/seção) extraídos em paralelo
+EXTRACAO_TAMANHO_BLOCO = int(os.getenv("MEDBOT_EXTRACAO_TAMANHO_BLOCO", "6000"))
+EXTRACAO_CONCORRENCIA = int(os.getenv("MEDBOT_EXTRACAO_CONCORRENCIA", "4"))
 
-LISTA_TERMOS = list(_glossario.keys())
+# Poda do glossário no prompt: cada bloco leva só os termos que podem estar no seu texto.
+# Com menos candidatos que o mínimo (ex: layout muito diferente), vai o glossário inteiro.
+PODA_PROMPT_ATIVA = os.getenv("MEDBOT_PODA_PROMPT", "1") == "1"
+PODA_PROMPT_MINIMO_TERMOS = int(os.getenv("MEDBOT_PODA_PROMPT_MINIMO_TERMOS", "1"))
 
 # Prompt que usa a lista de termos do glossário
-EXTRACTOR_PROMPT = f"""
+EXTRACTOR_PROMPT_TEMPLATE = """
 Você é um assistente especializado em extrair dados de exames médicos de laudos laboratoriais.
 
 Sua tarefa:
@@ -52,28 +57,182 @@ Regras IMPORTANTES:
 - SUA RESPOSTA DEVE SER UM ÚNICO OBJETO JSON VÁLIDO COMEÇANDO COM {{ E TERMINANDO COM }}.
 
 Glossário disponível (lista de termos válidos):
-{LISTA_TERMOS}
+{lista_termos}
 """
 
+# O glossário só é lido e compilado na primeira extração (ou no aquecimento da aplicação)
+@cache
+def obter_indice_termos() -> IndiceTermos:
+    glossario = obter_glossario()
+    return IndiceTermos(glossario, {termo: sinonimos_da_descricao(dados.get("descricao", "")) for termo, dados in glossario.items()})
+
+@lru_cache(maxsize=512)
+def prompt_extrator(termos: tuple[str, ...] | None = None) -> str:
+    """Prompt do extrator com a lista de termos informada (por padrão, o glossário inteiro)."""
+    return EXTRACTOR_PROMPT_TEMPLATE.format(lista_termos=list(termos) if termos is not None else lista_termos())
+
+def termos_para_prompt(texto: str) -> tuple[str, ...] | None:
+    """Termos do glossário a enviar junto com o texto, ou None para enviar o glossário inteiro."""
+    if not PODA_PROMPT_ATIVA:
+        return None
+    candidatos = obter_indice_termos().termos_candidatos(texto)
+    if candidatos is None or len(candidatos) < PODA_PROMPT_MINIMO_TERMOS:
+        return None
+    return tuple(candidatos)
+
+# Tamanho dos prompts do extrator com e sem a poda (tokens estimados em ~4 caracteres cada)
+_metricas_prompt = {"prompts": 0, "podados": 0, "termos_enviados": 0, "termos_glossario": 0, "caracteres_enviados": 0, "caracteres_sem_poda": 0}
+_lock_metricas_prompt = threading.Lock()
+
+def _registrar_prompt(termos: tuple[str, ...] | None, prompt: str) -> None:
+    total_termos = len(obter_indice_termos().termos)
+    with _lock_metricas_prompt:
+        _metricas_prompt["prompts"] += 1
+        _metricas_prompt["podados"] += termos is not None
+        _metricas_prompt["termos_enviados"] += len(termos) if termos is not None else total_termos
+        _metricas_prompt["termos_glossario"] += total_termos
+        _metricas_prompt["caracteres_enviados"] += len(prompt)
+        _metricas_prompt["caracteres_sem_poda"] += len(prompt_extrator())
+
+def estatisticas_prompt_extrator() -> dict:
+    with _lock_metricas_prompt:
+        metricas = dict(_metricas_prompt)
+    sem_poda = metricas["caracteres_sem_poda"]
+    metricas["tokens_estimados_enviados"] = metricas["caracteres_enviados"] // 4
+    metricas["tokens_estimados_economizados"] = (sem_poda - metricas["caracteres_enviados"]) // 4
+    metricas["reducao"] = round(1 - metricas["caracteres_enviados"] / sem_poda, 4) if sem_poda else 0.0
+    return metricas
+
+def _coletar_metricas_prompt():
+    metricas = estatisticas_prompt_extrator()
+    yield ("medbot_prompt_extrator_total", "counter", "Prompts do extrator enviados, podados ou não.", [
+        ({"poda": "sim"}, metricas["podados"]), ({"poda": "nao"}, metricas["prompts"] - metricas["podados"]),
+    ])
+    yield ("medbot_prompt_extrator_caracteres_total", "counter", "Caracteres dos prompts do extrator, enviados e sem a poda.", [
+        ({"versao": "enviado"}, metricas["caracteres_enviados"]), ({"versao": "sem_poda"}, metricas["caracteres_sem_poda"]),
+    ])
+
+registrar_coletor(_coletar_metricas_prompt)
+
+# Cache das extrações por documento, compartilhado entre os workers pelo SQLite em disco
+_cache_documentos = CacheHibrido(
+    "documentos",
+    max_memoria=int(os.getenv("MEDBOT_CACHE_DOCUMENTOS_MAX_MEMORIA", "64")),
+    max_disco=int(os.getenv("MEDBOT_CACHE_DOCUMENTOS_MAX_DISCO", "5000")),
+    ttl_segundos=float(os.getenv("MEDBOT_CACHE_DOCUMENTOS_TTL", str(7 * 24 * 3600))),
+)
+
+def chave_documento(sha256_pdf: str) -> str:
+    """Chave de cache do PDF: hash do conteúdo + versões do prompt do extrator, do glossário e do parser local."""
+    return gerar_chave(
+        "documento", sha256_pdf, hash_texto(EXTRACTOR_PROMPT_TEMPLATE), versao_glossario(),
+        PARSER_LOCAL_ATIVO, VERSAO_PARSER, EXTRACAO_TAMANHO_BLOCO, PODA_PROMPT_ATIVA, PODA_PROMPT_MINIMO_TERMOS,
+    )
+
+def buscar_extracao_em_cache(chave: str) -> dict | None:
+    return _cache_documentos.get(chave)
+
+def salvar_extracao_em_cache(chave: str, data: dict) -> None:
+    _cache_documentos.set(chave, data)
+
+def estatisticas_cache_documentos() -> dict:
+    return _cache_documentos.estatisticas()
+
 async def extract_structured_data(text: str) -> dict:
-    if not api_key:
+    """Extrai os grupos do laudo, usando a IA apenas para o que o parser local não resolveu."""
+    if not PARSER_LOCAL_ATIVO:
+        return await extract_structured_data_ai(text)
+
+    grupos_locais, pendencias = extrair_localmente(text, obter_indice_termos())
+    if not grupos_locais:
+        # Layout desconhecido: o documento inteiro vai para a IA
+        return await extract_structured_data_ai(text)
+    if not pendencias:
+        return {"grupos": grupos_locais}
+
+    dados_ia = await extract_structured_data_ai(texto_das_pendencias(pendencias))
+    return {"grupos": mesclar_grupos(grupos_locais, dados_ia.get("grupos", []))}
+
+def _dividir_grande(trecho: str, tamanho: int) -> list[str]:
+    """Divide um trecho maior que o bloco em linhas inteiras (ou corta linhas gigantes)."""
+    partes, atual = [], ""
+    for linha in trecho.splitlines(keepends=True):
+        while len(linha) > tamanho:
+            if atual:
+                partes.append(atual)
+                atual = ""
+            partes.append(linha[:tamanho])
+            linha = linha[tamanho:]
+        if len(atual) + len(linha) > tamanho:
+            partes.append(atual)
+            atual = ""
+        atual += linha
+    if atual:
+        partes.append(atual)
+    return partes
+
+def dividir_em_blocos(text: str, tamanho: int = EXTRACAO_TAMANHO_BLOCO) -> list[str]:
+    """
+    Divide o texto em blocos de até `tamanho` caracteres sem cortar páginas nem seções:
+    as páginas são agrupadas enquanto couberem, e uma página grande é dividida nas
+    linhas em branco (fim de seção) ou, em último caso, em linhas.
+    """
+    unidades = []
+    for pagina in text.split(SEPARADOR_PAGINAS):
+        if len(pagina) <= tamanho:
+            unidades.append(pagina)
+            continue
+        for secao in re.split(r"(?<=\n)(?=[ \t]*\n)", pagina):
+            unidades.extend([secao] if len(secao) <= tamanho else _dividir_grande(secao, tamanho))
+
+    blocos, atual = [], ""
+    for unidade in unidades:
+        if atual and len(atual) + len(unidade) + 1 > tamanho:
+            blocos.append(atual)
+            atual = ""
+        atual = f"{atual}\n{unidade}" if atual else unidade
+    if atual.strip():
+        blocos.append(atual)
+    return [bloco for bloco in blocos if bloco.strip()]
+
+async def extract_structured_data_ai(text: str) -> dict:
+    """Extrai os grupos com a IA, processando os blocos do texto em paralelo e juntando o resultado."""
+    if not chave_configurada():
         raise ValueError("A variável de ambiente OPENAI_API_KEY não foi encontrada.")
 
-    # limitar tamanho se necessário
-    truncated_text = text[:12000]
+    blocos = dividir_em_blocos(text)
+    if len(blocos) <= 1:
+        return await _extrair_bloco(blocos[0] if blocos else text)
+
+    semaforo = asyncio.Semaphore(EXTRACAO_CONCORRENCIA)
+
+    async def extrair_limitado(bloco):
+        async with semaforo:
+            return await _extrair_bloco(bloco)
+
+    resultados = await asyncio.gather(*(extrair_limitado(bloco) for bloco in blocos))
+    grupos = []
+    for dados in resultados:
+        grupos = mesclar_grupos(grupos, dados.get("grupos", []))
+    return {"grupos": grupos}
 
+async def _extrair_bloco(truncated_text: str) -> dict:
+    termos = termos_para_prompt(truncated_text)
+    prompt = prompt_extrator(termos)
+    _registrar_prompt(termos, prompt)
     try:
-        resp = await client.chat.completions.create(
+        content = await completar(
             model="gpt-4o",
             messages=[
                 {"role": "system", "content": "Você é um assistente que extrai dados estruturados de exames médicos."},
-                {"role": "user", "content": EXTRACTOR_PROMPT + f"\\n\\nTexto do exame:\\n---\\n{truncated_text}\\n---"},
+                {"role": "user", "content": prompt + f"\\n\\nTexto do exame:\\n---\\n{truncated_text}\\n---"},
             ],
             temperature=0,
-            response_format={"type": "json_object"}  # força JSON válido
+            response_format={"type": "json_object"},  # força JSON válido
+            tipo="extracao",
         )
 
-        content = resp.choices[0].message.content.strip()
+        content = content.strip()
         data = json.loads(content)
         return data
 
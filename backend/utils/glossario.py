@@ -0,0 +1,43 @@
+import hashlib
+import json
+import threading
+from pathlib import Path
+
+# Único ponto de leitura do glossário. O arquivo é lido uma vez por processo, na primeira
+# consulta; carregado antes do fork (ex: gunicorn --preload) é compartilhado pelos workers.
+GLOSSARIO_FILE = Path(__file__).resolve().parent.parent / "data" / "glossario.json"
+
+_lock = threading.Lock()
+_dados: dict | None = None
+_versao: str | None = None
+
+
+def _carregar() -> None:
+    global _dados, _versao
+    with _lock:
+        if _dados is None:
+            with open(GLOSSARIO_FILE, "rb") as f:
+                conteudo = f.read()
+            # Versão do glossário: qualquer alteração no arquivo invalida o que foi derivado dele
+            _versao = hashlib.sha256(conteudo).hexdigest()[:16]
+            _dados = json.loads(conteudo.decode("utf-8"))
+
+
+def obter_glossario() -> dict:
+    if _dados is None:
+        _carregar()
+    return _dados
+
+
+def versao_glossario() -> str:
+    if _versao is None:
+        _carregar()
+    return _versao
+
+
+def lista_termos() -> list[str]:
+    return list(obter_glossario().keys())
+
+
+def carregado() -> bool:
+    return _dados is not None
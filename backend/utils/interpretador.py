@@ -1,12 +1,17 @@
-import json
 import os
 import re
+from functools import cache
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-GLOSSARIO_PATH = os.path.join(BASE_DIR, "..", "data", "glossario.json")
+try:
+    import numpy as np
+except ImportError:  # NumPy é opcional: sem ele o lote é classificado item a item
+    np = None
 
-with open(GLOSSARIO_PATH, "r", encoding="utf-8") as f:
-    glossario = json.load(f)
+from utils.glossario import obter_glossario
+from utils.resolvedor_termos import RESOLVEDOR_ATIVO, obter_resolvedor
+
+# Abaixo deste tamanho o custo de montar os vetores NumPy não compensa
+LOTE_MINIMO_NUMPY = int(os.getenv("MEDBOT_LOTE_MINIMO_NUMPY", "64"))
 
 def parse_interval(intervalo: str):
     # (Sua função de parse continua a mesma)
@@ -19,53 +24,166 @@ def parse_interval(intervalo: str):
     if len(numeros) == 1: return float(numeros[0]), float(numeros[0])
     return None, None
 
-def interpretar_exame(termo: str, valor: float, idade: int, sexo: str) -> tuple[str, str]:
-    termo_lower = termo.lower().strip()
-    glossario_entry = glossario.get(termo_lower)
+def _parse_faixa_etaria(faixa: str):
+    """Converte chaves como "18-70" ou "70+" em (idade_min, idade_max); None se a chave não for de idade."""
+    if "+" in faixa:
+        return int(faixa.replace("+", "")), float("inf")
+    if "-" in faixa:
+        ini, fim = faixa.split("-")
+        return int(ini), int(fim)
+    return None
+
+def compilar_indice(glossario: dict) -> dict:
+    """
+    Pré-processa o glossário uma única vez: para cada termo e sexo guarda as faixas
+    etárias já convertidas e os limites numéricos (mínimo, máximo) de cada referência.
+    """
+    indice = {}
+    for termo, entry in glossario.items():
+        por_sexo = {}
+        for sexo_ref, faixas in entry.get("referencias", {}).items():
+            intervalos = []
+            for faixa, limites in faixas.items():
+                idades = _parse_faixa_etaria(faixa)
+                if idades is not None:
+                    intervalos.append((idades[0], idades[1], limites, *parse_interval(limites)))
+            padrao = faixas.get("padrão")
+            por_sexo[sexo_ref] = {
+                "intervalos": intervalos,
+                "padrao": (padrao, *parse_interval(padrao)) if padrao else None,
+            }
+        indice[termo] = {
+            "descricao": entry.get("descricao", "Descrição não disponível."),
+            "interpretacao": entry.get("interpretacao", ""),
+            "por_sexo": por_sexo,
+        }
+    return indice
+
+@cache
+def obter_indice() -> dict:
+    """Índice compilado uma vez por processo, na primeira interpretação (ou no aquecimento)."""
+    return compilar_indice(obter_glossario())
+
+def _escolher_faixa(entry: dict, idade: int, sexo: str):
+    """Retorna (faixa, mínimo, máximo) da referência aplicável, ou None."""
+    por_sexo = entry["por_sexo"]
+    ref_sexo = por_sexo.get(sexo.lower(), por_sexo.get("geral"))
+    if not ref_sexo:
+        return None
+    for ini, fim, limites, minimo, maximo in ref_sexo["intervalos"]:
+        if ini <= idade <= fim:
+            return limites, minimo, maximo
+    return ref_sexo["padrao"]
+
+# Códigos de classificação usados tanto no caminho escalar quanto no vetorizado
+_STATUS = [
+    ("dentro do normal", "normal"),
+    ("abaixo do normal", "baixo"),
+    ("acima do normal", "alto"),
+    ("diferente do valor de referência", "alto"),  # Trata como alterado
+]
+
+def _classificar(valor: float, minimo, maximo) -> int:
+    if minimo is not None and maximo is not None and minimo == maximo:
+        return 3 if valor != minimo else 0
+    if minimo is not None and valor < minimo:
+        return 1
+    if maximo is not None and valor > maximo:
+        return 2
+    return 0
+
+def _classificar_vetorizado(valores, minimos, maximos) -> list[int]:
+    """Mesma regra de _classificar aplicada a vetores NumPy (limites ausentes viram NaN)."""
+    valores = np.asarray(valores, dtype=float)
+    minimos = np.array([np.nan if m is None else m for m in minimos], dtype=float)
+    maximos = np.array([np.nan if m is None else m for m in maximos], dtype=float)
+
+    exato = minimos == maximos
+    codigos = np.zeros(len(valores), dtype=np.int8)
+    codigos[exato & (valores != minimos)] = 3
+    baixo = ~exato & (valores < minimos)
+    codigos[baixo] = 1
+    codigos[~exato & ~baixo & (valores > maximos)] = 2
+    return codigos.tolist()
 
+def _buscar_entradas(termos: list[str]) -> list[dict | None]:
+    """
+    Entradas do índice para cada termo. Nomes que não são chaves do glossário ("Creatinina
+    sérica", "T4 Livre") passam, todos de uma vez, pelo resolvedor local de termos.
+    """
+    indice = obter_indice()
+    entradas = [indice.get(termo.lower().strip()) for termo in termos]
+    desconhecidos = [i for i, entry in enumerate(entradas) if entry is None]
+    if desconhecidos and RESOLVEDOR_ATIVO:
+        chaves = obter_resolvedor().resolver_lote([termos[i] for i in desconhecidos])
+        for i, chave in zip(desconhecidos, chaves):
+            entradas[i] = indice.get(chave) if chave else None
+    return entradas
+
+def _pre_interpretar(entry: dict | None, termo: str, valor: float, idade: int, sexo: str):
+    """Resolve tudo que não depende da comparação numérica. Retorna o resultado final ou a faixa a comparar."""
     # MUDANÇA: Lógica mais clara para quando o termo não é encontrado
-    if not glossario_entry:
-        return f"O termo '{termo}' não foi encontrado em nossa base de dados para análise.", "indeterminado"
-    
+    if not entry:
+        return (f"O termo '{termo}' não foi encontrado em nossa base de dados para análise.", "indeterminado"), None
+
     # Se o valor não for numérico, não podemos interpretar
     if valor is None:
-        return glossario_entry.get("descricao", "Descrição não disponível."), "normal"
-
-    desc = glossario_entry.get("descricao", "Descrição não disponível.")
-    interpretacao = glossario_entry.get("interpretacao", "")
-    referencias = glossario_entry.get("referencias", {})
-    ref_sexo = referencias.get(sexo.lower(), referencias.get("geral", {}))
-    
-    faixa_escolhida = None
-    for faixa, limites in ref_sexo.items():
-        if "+" in faixa and idade >= int(faixa.replace("+", "")):
-            faixa_escolhida = limites
-            break
-        elif "-" in faixa:
-            ini, fim = faixa.split("-")
-            if int(ini) <= idade <= int(fim):
-                faixa_escolhida = limites
-                break
-    if not faixa_escolhida and "padrão" in ref_sexo:
-        faixa_escolhida = ref_sexo["padrão"]
-
-    if not faixa_escolhida:
-        return f"{desc} {interpretacao}", "normal"
-
-    minimo, maximo = parse_interval(faixa_escolhida)
-    status_text = "dentro do normal"
-    status_code = "normal"
+        return (entry["descricao"], "normal"), None
 
-    if minimo is not None and maximo is not None and minimo == maximo:
-         if valor != minimo:
-            status_text = "diferente do valor de referência"
-            status_code = "alto" # Trata como alterado
-    elif minimo is not None and valor < minimo:
-        status_text = "abaixo do normal"
-        status_code = "baixo"
-    elif maximo is not None and valor > maximo:
-        status_text = "acima do normal"
-        status_code = "alto"
-        
-    resultado_final = f"Seu resultado foi **{valor}**, que está **{status_text}**. (Referência: {faixa_escolhida}). {interpretacao}"
+    faixa = _escolher_faixa(entry, idade, sexo)
+    if not faixa or not faixa[0]:
+        return (f"{entry['descricao']} {entry['interpretacao']}", "normal"), None
+    return None, (entry, faixa)
+
+def _montar_resultado(valor: float, entry: dict, faixa_escolhida: str, codigo: int) -> tuple[str, str]:
+    status_text, status_code = _STATUS[codigo]
+    resultado_final = f"Seu resultado foi **{valor}**, que está **{status_text}**. (Referência: {faixa_escolhida}). {entry['interpretacao']}"
     return resultado_final, status_code
+
+def interpretar_exame(termo: str, valor: float, idade: int, sexo: str) -> tuple[str, str]:
+    pronto, pendente = _pre_interpretar(_buscar_entradas([termo])[0], termo, valor, idade, sexo)
+    if pronto:
+        return pronto
+    entry, (faixa_escolhida, minimo, maximo) = pendente
+    return _montar_resultado(valor, entry, faixa_escolhida, _classificar(valor, minimo, maximo))
+
+def desvio_da_referencia(termo: str, valor: float, idade: int, sexo: str) -> float:
+    """Quanto o valor se afasta da faixa de referência, relativo ao limite ultrapassado (0 se dentro ou sem referência)."""
+    pronto, pendente = _pre_interpretar(_buscar_entradas([termo])[0], termo, valor, idade, sexo)
+    if pronto:
+        return 0.0
+    _, (_, minimo, maximo) = pendente
+    codigo = _classificar(valor, minimo, maximo)
+    limite = {1: minimo, 2: maximo, 3: minimo}.get(codigo)
+    if limite is None:
+        return 0.0
+    return abs(valor - limite) / abs(limite) if limite else abs(valor - limite)
+
+def interpretar_lote(itens: list[tuple[str, float, int, str]]) -> list[tuple[str, str]]:
+    """
+    Interpreta vários resultados de uma vez. Cada item é (termo, valor, idade, sexo),
+    podendo misturar pacientes diferentes. Com NumPy disponível, a comparação com as
+    referências é feita de forma vetorizada.
+    """
+    resultados = [None] * len(itens)
+    pendentes = []
+    entradas = _buscar_entradas([termo for termo, _, _, _ in itens])
+    for i, ((termo, valor, idade, sexo), entry) in enumerate(zip(itens, entradas)):
+        pronto, pendente = _pre_interpretar(entry, termo, valor, idade, sexo)
+        if pronto:
+            resultados[i] = pronto
+        else:
+            pendentes.append((i, valor, *pendente))
+
+    if pendentes:
+        valores = [valor for _, valor, _, _ in pendentes]
+        minimos = [faixa[1] for _, _, _, faixa in pendentes]
+        maximos = [faixa[2] for _, _, _, faixa in pendentes]
+        if np is not None and len(pendentes) >= LOTE_MINIMO_NUMPY:
+            codigos = _classificar_vetorizado(valores, minimos, maximos)
+        else:
+            codigos = [_classificar(v, mn, mx) for v, mn, mx in zip(valores, minimos, maximos)]
+        for (i, valor, entry, faixa), codigo in zip(pendentes, codigos):
+            resultados[i] = _montar_resultado(valor, entry, faixa[0], codigo)
+
+    return resultados
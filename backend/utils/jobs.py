@@ -0,0 +1,159 @@
+import asyncio
+import os
+import secrets
+import time
+
+from utils.cache import CacheHibrido
+from utils.metricas import Contador, Histograma, registrar_coletor
+
+# Lotes de PDFs processados em segundo plano: o endpoint só copia os arquivos e devolve um
+# job_id; JOBS_WORKERS tarefas por processo consomem a fila, e as chamadas ao modelo continuam
+# passando pelos mesmos limites globais (token bucket, semáforos) das requisições interativas.
+JOBS_WORKERS = int(os.getenv("MEDBOT_JOBS_WORKERS", "4"))
+JOBS_MAX_ARQUIVOS = int(os.getenv("MEDBOT_JOBS_MAX_ARQUIVOS", "100"))
+JOBS_MAX_PENDENTES = int(os.getenv("MEDBOT_JOBS_MAX_PENDENTES", "200"))
+JOBS_MAX_BYTES = int(os.getenv("MEDBOT_JOBS_MAX_BYTES", str(200 * 1024 * 1024)))
+JOBS_TTL_SEGUNDOS = float(os.getenv("MEDBOT_JOBS_TTL", str(24 * 3600)))
+
+# Sem camada em memória: o estado é lido do SQLite a cada consulta, assim qualquer worker
+# responde pelo job, mesmo que ele esteja sendo processado em outro processo
+_estado_jobs = CacheHibrido("jobs", max_memoria=0, max_disco=int(os.getenv("MEDBOT_JOBS_MAX_DISCO", "5000")), ttl_segundos=JOBS_TTL_SEGUNDOS)
+_resultados_jobs = CacheHibrido("jobs_resultados", max_memoria=0, max_disco=int(os.getenv("MEDBOT_JOBS_RESULTADOS_MAX_DISCO", "50000")), ttl_segundos=JOBS_TTL_SEGUNDOS)
+
+jobs_arquivos = Contador("medbot_jobs_arquivos_total", "Arquivos processados pelos jobs em lote, por resultado.", ("resultado",))
+jobs_arquivo_segundos = Histograma("medbot_jobs_arquivo_segundos", "Tempo de processamento de cada arquivo de um job.", ("resultado",))
+
+
+_filas: list["FilaDeJobs"] = []
+
+
+class FilaCheia(Exception):
+    """A fila de arquivos pendentes não comporta o lote enviado."""
+
+
+class FilaDeJobs:
+    """
+    Fila em memória com um conjunto fixo de workers. `processar(upload, filename, idade, sexo, **opcoes)`
+    é a mesma rotina do /analyze-pdf/; erros com `status_code` e `detail` (HTTPException)
+    são registrados no arquivo como estão, os demais como erro 500.
+    """
+
+    def __init__(self, processar, workers: int = JOBS_WORKERS):
+        self.processar = processar
+        self.workers = max(1, workers)
+        self._fila: asyncio.Queue | None = None
+        self._tarefas: list[asyncio.Task] = []
+        # Estado dos jobs deste processo, gravado no SQLite a cada mudança
+        self._jobs: dict[str, dict] = {}
+        _filas.append(self)
+
+    def iniciar(self) -> None:
+        self._fila = asyncio.Queue()
+        self._tarefas = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def encerrar(self) -> None:
+        for tarefa in self._tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*self._tarefas, return_exceptions=True)
+        self._tarefas = []
+        # Arquivos ainda na fila não serão processados: libera os temporários e marca o erro
+        while self._fila is not None and not self._fila.empty():
+            job_id, indice, upload, _, _, _, _ = self._fila.get_nowait()
+            upload.fechar()
+            self._finalizar_arquivo(job_id, indice, "erro", erro="O servidor foi reiniciado antes do processamento. Envie o arquivo novamente.", status_http=503)
+
+    def pendentes(self) -> int:
+        return self._fila.qsize() if self._fila is not None else 0
+
+    def criar_job(self, arquivos: list[tuple[str, object, int, str]], **opcoes) -> dict:
+        """Enfileira os arquivos (nome, upload, idade, sexo) e devolve o estado inicial do job."""
+        if self._fila is None:
+            raise RuntimeError("A fila de jobs não foi iniciada.")
+        if self.pendentes() + len(arquivos) > JOBS_MAX_PENDENTES:
+            raise FilaCheia(f"A fila de processamento está cheia ({self.pendentes()} arquivos pendentes). Tente novamente em alguns minutos.")
+
+        job_id = secrets.token_urlsafe(16)
+        agora = time.time()
+        job = {
+            "job_id": job_id,
+            "status": "na_fila",
+            "criado_em": agora,
+            "atualizado_em": agora,
+            "total": len(arquivos),
+            "concluidos": 0,
+            "erros": 0,
+            "opcoes": opcoes,
+            "arquivos": [
+                {"indice": indice, "filename": nome, "idade": idade, "sexo": sexo, "status": "na_fila", "erro": None, "status_http": None, "duracao_ms": None}
+                for indice, (nome, _, idade, sexo) in enumerate(arquivos)
+            ],
+        }
+        self._jobs[job_id] = job
+        _estado_jobs.set(job_id, job)
+        for indice, (nome, upload, idade, sexo) in enumerate(arquivos):
+            self._fila.put_nowait((job_id, indice, upload, nome, idade, sexo, opcoes))
+        return job
+
+    async def _worker(self) -> None:
+        while True:
+            job_id, indice, upload, nome, idade, sexo, opcoes = await self._fila.get()
+            inicio = time.perf_counter()
+            self._atualizar_arquivo(job_id, indice, "processando")
+            try:
+                resultado = await self.processar(upload, nome, idade, sexo, **opcoes)
+            except asyncio.CancelledError:
+                self._finalizar_arquivo(job_id, indice, "erro", erro="O servidor foi reiniciado durante o processamento. Envie o arquivo novamente.", status_http=503)
+                raise
+            except Exception as e:
+                status_http = getattr(e, "status_code", 500)
+                erro = getattr(e, "detail", None) or f"Ocorreu um erro inesperado no servidor: {str(e)}"
+                duracao = time.perf_counter() - inicio
+                jobs_arquivo_segundos.observar(duracao, "erro")
+                self._finalizar_arquivo(job_id, indice, "erro", erro=erro, status_http=status_http, duracao=duracao)
+            else:
+                duracao = time.perf_counter() - inicio
+                jobs_arquivo_segundos.observar(duracao, "concluido")
+                _resultados_jobs.set(f"{job_id}:{indice}", resultado)
+                self._finalizar_arquivo(job_id, indice, "concluido", status_http=200, duracao=duracao)
+            finally:
+                upload.fechar()
+                self._fila.task_done()
+
+    def _atualizar_arquivo(self, job_id: str, indice: int, status: str) -> None:
+        job = self._jobs[job_id]
+        job["arquivos"][indice]["status"] = status
+        if job["status"] == "na_fila":
+            job["status"] = "processando"
+        job["atualizado_em"] = time.time()
+        _estado_jobs.set(job_id, job)
+
+    def _finalizar_arquivo(self, job_id: str, indice: int, status: str, erro: str | None = None, status_http: int | None = None, duracao: float | None = None) -> None:
+        job = self._jobs[job_id]
+        arquivo = job["arquivos"][indice]
+        arquivo.update(status=status, erro=erro, status_http=status_http)
+        if duracao is not None:
+            arquivo["duracao_ms"] = round(duracao * 1000, 1)
+        job["concluidos" if status == "concluido" else "erros"] += 1
+        jobs_arquivos.inc(status)
+        if job["concluidos"] + job["erros"] == job["total"]:
+            job["status"] = "concluido"
+            # Terminado, o job só precisa continuar no SQLite
+            del self._jobs[job_id]
+        job["atualizado_em"] = time.time()
+        _estado_jobs.set(job_id, job)
+
+
+def obter_job(job_id: str) -> dict | None:
+    return _estado_jobs.get(job_id)
+
+
+def obter_resultado_job(job_id: str, indice: int) -> dict | None:
+    return _resultados_jobs.get(f"{job_id}:{indice}")
+
+
+def _coletar_metricas_jobs():
+    yield ("medbot_jobs_workers", "gauge", "Workers de jobs em lote neste processo.", [({}, sum(len(f._tarefas) for f in _filas))])
+    yield ("medbot_jobs_arquivos_pendentes", "gauge", "Arquivos na fila dos jobs em lote.", [({}, sum(f.pendentes() for f in _filas))])
+
+
+registrar_coletor(_coletar_metricas_jobs)
@@ -0,0 +1,222 @@
+import asyncio
+import os
+import random
+import time
+from abc import ABC, abstractmethod
+from contextvars import ContextVar
+
+import httpx
+from dotenv import load_dotenv
+
+from utils import metricas
+
+load_dotenv()
+
+# Pool HTTP, limites de vazão e política de novas tentativas compartilhados por todas as chamadas ao modelo
+LLM_BASE_URL = os.getenv("MEDBOT_LLM_BASE_URL") or None
+LLM_MAX_CONEXOES = int(os.getenv("MEDBOT_LLM_MAX_CONEXOES", "50"))
+LLM_MAX_EM_VOO = int(os.getenv("MEDBOT_LLM_MAX_EM_VOO", "32"))
+LLM_REQ_POR_SEGUNDO = float(os.getenv("MEDBOT_LLM_REQ_POR_SEGUNDO", "10"))
+LLM_RAJADA = int(os.getenv("MEDBOT_LLM_RAJADA", "20"))
+LLM_TENTATIVAS = int(os.getenv("MEDBOT_LLM_TENTATIVAS", "3"))
+LLM_TIMEOUT_SEGUNDOS = float(os.getenv("MEDBOT_LLM_TIMEOUT", "60"))
+LLM_ESPERA_BASE_SEGUNDOS = float(os.getenv("MEDBOT_LLM_ESPERA_BASE", "0.5"))
+LLM_ESPERA_MAXIMA_SEGUNDOS = float(os.getenv("MEDBOT_LLM_ESPERA_MAXIMA", "8"))
+
+
+# Tipo de prompt da chamada em andamento, usado para rotular os tokens informados pelo backend
+_tipo_chamada: ContextVar[str] = ContextVar("tipo_chamada", default="outro")
+
+
+class LLMIndisponivel(Exception):
+    """O modelo continuou respondendo 429/5xx (ou sem conexão) depois de todas as tentativas."""
+
+
+class BackendLLM(ABC):
+    """
+    Interface de backend. Implementações recebem os mesmos argumentos da API de chat da
+    OpenAI e devolvem o texto da resposta. Erros transitórios devem ter `status_code`
+    429/5xx ou ser LLMIndisponivel para que sejam repetidos. O consumo de tokens, quando
+    conhecido, é informado com registrar_uso().
+    """
+
+    @abstractmethod
+    async def completar(self, model: str, messages: list[dict], temperature: float, response_format: dict | None) -> str:
+        """Texto da resposta do modelo."""
+
+    async def fechar(self) -> None:
+        pass
+
+
+class BackendOpenAI(BackendLLM):
+    """Backend padrão. Com MEDBOT_LLM_BASE_URL aponta para qualquer servidor compatível (ex: um stub local)."""
+
+    def __init__(self, api_key: str, base_url: str | None = None):
+        # Importado aqui para não pesar no import da aplicação
+        from openai import AsyncOpenAI, APIConnectionError, APITimeoutError
+
+        self._erros_de_conexao = (APIConnectionError, APITimeoutError)
+        self._http = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=LLM_MAX_CONEXOES, max_keepalive_connections=LLM_MAX_CONEXOES),
+            timeout=httpx.Timeout(LLM_TIMEOUT_SEGUNDOS, connect=10.0),
+        )
+        # As novas tentativas ficam a cargo deste módulo
+        self._client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=self._http, max_retries=0)
+
+    async def completar(self, model, messages, temperature, response_format):
+        kwargs = {"model": model, "messages": messages, "temperature": temperature}
+        if response_format:
+            kwargs["response_format"] = response_format
+        try:
+            resp = await self._client.chat.completions.create(**kwargs)
+        except self._erros_de_conexao as e:
+            raise LLMIndisponivel(str(e)) from e
+        if resp.usage is not None:
+            registrar_uso(model, resp.usage.prompt_tokens, resp.usage.completion_tokens)
+        return resp.choices[0].message.content
+
+    async def fechar(self):
+        await self._http.aclose()
+
+
+class BaldeDeTokens:
+    """Limitador de vazão: até `capacidade` chamadas em rajada, repostas a `taxa` por segundo."""
+
+    def __init__(self, taxa: float, capacidade: int):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self._tokens = float(capacidade)
+        self._ultimo = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def adquirir(self) -> None:
+        if self.taxa <= 0:
+            return
+        async with self._lock:
+            while True:
+                agora = time.monotonic()
+                self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa)
+                self._ultimo = agora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.taxa)
+
+
+_backend: BackendLLM | None = None
+_balde = BaldeDeTokens(LLM_REQ_POR_SEGUNDO, LLM_RAJADA)
+_em_voo = asyncio.Semaphore(LLM_MAX_EM_VOO)
+
+
+def chave_configurada() -> bool:
+    return bool(os.getenv("OPENAI_API_KEY")) or _backend is not None
+
+
+def obter_backend() -> BackendLLM:
+    """Cria o backend OpenAI na primeira chamada, a menos que outro tenha sido definido."""
+    global _backend
+    if _backend is None:
+        api_key = os.getenv("OPENAI_API_KEY")
+        if not api_key:
+            raise ValueError("A variável de ambiente OPENAI_API_KEY não foi encontrada.")
+        _backend = BackendOpenAI(api_key, LLM_BASE_URL)
+    return _backend
+
+
+def definir_backend(backend: BackendLLM | None) -> None:
+    """Troca o backend (ex: um stub em testes e benchmarks). None volta ao OpenAI padrão."""
+    global _backend
+    _backend = backend
+
+
+async def fechar() -> None:
+    global _backend
+    if _backend is not None:
+        await _backend.fechar()
+        _backend = None
+
+
+def registrar_uso(model: str, tokens_prompt: int, tokens_resposta: int) -> None:
+    """Soma os tokens de uma resposta às métricas, rotulados pelo tipo de prompt da chamada atual."""
+    tipo = _tipo_chamada.get()
+    metricas.llm_tokens.inc(model, tipo, "prompt", valor=tokens_prompt or 0)
+    metricas.llm_tokens.inc(model, tipo, "resposta", valor=tokens_resposta or 0)
+
+
+def _eh_transitorio(erro: Exception) -> bool:
+    if isinstance(erro, (LLMIndisponivel, httpx.TransportError)):
+        return True
+    status = getattr(erro, "status_code", None)
+    return status == 429 or (status is not None and status >= 500)
+
+
+def _espera(erro: Exception, tentativa: int) -> float:
+    """Backoff exponencial com jitter total; respeita o Retry-After quando o servidor envia."""
+    resposta = getattr(erro, "response", None)
+    retry_after = resposta.headers.get("retry-after") if resposta is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), LLM_ESPERA_MAXIMA_SEGUNDOS)
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_ESPERA_MAXIMA_SEGUNDOS, LLM_ESPERA_BASE_SEGUNDOS * 2 ** tentativa))
+
+
+async def completar(
+    messages: list[dict],
+    model: str = "gpt-4o",
+    temperature: float = 0,
+    response_format: dict | None = None,
+    timeout: float | None = None,
+    tipo: str = "outro",
+) -> str:
+    """
+    Faz uma chamada de chat ao modelo e devolve o texto da resposta. Aplica o limite de
+    vazão e de chamadas simultâneas, repete erros 429/5xx com backoff e respeita um prazo
+    total (`timeout`, em segundos) que inclui as novas tentativas. `tipo` identifica o
+    prompt (ex: "extracao") nas métricas de latência e de tokens.
+    """
+    backend = obter_backend()
+    token_tipo = _tipo_chamada.set(tipo)
+    inicio = time.perf_counter()
+    resultado = "erro"
+    try:
+        resposta = await _completar_com_tentativas(backend, messages, model, temperature, response_format, timeout, tipo)
+        resultado = "ok"
+        return resposta
+    except LLMIndisponivel:
+        resultado = "indisponivel"
+        raise
+    except (TimeoutError, asyncio.TimeoutError):
+        resultado = "timeout"
+        raise
+    finally:
+        metricas.llm_segundos.observar(time.perf_counter() - inicio, model, tipo)
+        metricas.llm_chamadas.inc(model, tipo, resultado)
+        _tipo_chamada.reset(token_tipo)
+
+
+async def _completar_com_tentativas(backend, messages, model, temperature, response_format, timeout, tipo) -> str:
+    prazo = time.monotonic() + (timeout or LLM_TIMEOUT_SEGUNDOS)
+
+    for tentativa in range(LLM_TENTATIVAS):
+        restante = prazo - time.monotonic()
+        if restante <= 0:
+            raise TimeoutError("Prazo da chamada ao modelo esgotado.")
+        try:
+            async with _em_voo:
+                await _balde.adquirir()
+                return await asyncio.wait_for(
+                    backend.completar(model, messages, temperature, response_format),
+                    timeout=prazo - time.monotonic(),
+                )
+        except Exception as e:
+            if not _eh_transitorio(e):
+                raise
+            espera = _espera(e, tentativa)
+            if tentativa == LLM_TENTATIVAS - 1 or time.monotonic() + espera >= prazo:
+                raise LLMIndisponivel(f"O modelo está indisponível no momento: {e}") from e
+            metricas.llm_novas_tentativas.inc(model, tipo)
+            await asyncio.sleep(espera)
+
+    raise LLMIndisponivel("O modelo está indisponível no momento.")
@@ -0,0 +1,316 @@
+import re
+import unicodedata
+
+# Versão das regras de extração local: entra na chave do cache de documentos, para que uma
+# mudança no parser não continue servindo extrações feitas pela versão anterior
+VERSAO_PARSER = 2
+
+# Padrões pré-compilados para valores e unidades de laudos laboratoriais
+RE_VALOR = re.compile(r"^\d{1,3}(?:\.\d{3})+(?:,\d+)?$|^\d+(?:[.,]\d+)?$")
+RE_UNIDADE = re.compile(r"^(?:%|[/µμ]|[^\W\d_])[^\s:]{0,24}$")
+RE_FAIXA = re.compile(r"^\s*(?:a|até|-)\s*\d", re.IGNORECASE)
+
+# Rótulos administrativos ou de valores de referência que nunca são resultados
+ROTULOS_IGNORADOS = (
+    "idade", "coleta", "liberacao", "data", "cpf", "rg", "impresso", "nro", "documento", "convenio",
+    "material", "metodo", "assinatura", "assinado", "pagina", "fonte", "nota", "observacao",
+    "resultados anteriores", "referencia", "valor", "valores", "homens", "mulheres", "criancas",
+    "adultos", "acima", "abaixo", "entre", "menor", "maior", "ate", "desejavel", "limitrofe", "aumentado",
+    "normal", "risco", "alvo", "otimo", "deficiencia", "inferior", "superior", "dr", "sr",
+)
+
+# Palavras curtas demais ou genéricas demais para indicar sozinhas um exame
+PALAVRAS_SEM_PESO = {"de", "do", "da", "dos", "das", "e", "em", "no", "na", "por"}
+
+# Sinônimos que as próprias descrições do glossário trazem: "Sigla para Volume Corpuscular Médio",
+# "conhecida como TGO (Transaminase Glutâmico-Oxalacética)"
+RE_SINONIMO = re.compile(r"(?:sigla para|conhecid[oa]s? como) ([^.,;:]+)", re.IGNORECASE)
+
+# Prefixos que os laudos põem antes do nome sem mudar o exame ("Contagem de Plaquetas")
+PREFIXOS_NEUTROS = ("contagem total de ", "contagem de ", "dosagem de ")
+
+GRUPO_SEM_TITULO = "Resultados"
+GRUPO_SECOES_AVULSAS = "Outros Exames"
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sem acentos e com espaços simples, para comparar nomes de exames."""
+    sem_acentos = "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", sem_acentos.lower()).strip()
+
+
+def sinonimos_da_descricao(descricao: str) -> list[str]:
+    """'conhecidas como glóbulos vermelhos ou eritrócitos' -> ['glóbulos vermelhos', 'eritrócitos']."""
+    return [
+        sinonimo.strip(" '\"")
+        for trecho in RE_SINONIMO.findall(descricao)
+        for sinonimo in re.split(r"\s+ou\s+|\s+e\s+", trecho)
+        if sinonimo.strip(" '\"")
+    ]
+
+
+class IndiceTermos:
+    """
+    Índice compilado com todas as chaves do glossário. Uma única expressão regular
+    (alternância ordenada do termo mais longo para o mais curto) encontra os termos
+    em uma só passada pelo texto.
+    """
+
+    def __init__(self, termos, sinonimos: dict[str, list[str]] | None = None):
+        self.por_nome: dict[str, str] = {}
+        for termo in termos:
+            self.por_nome.setdefault(normalizar(termo), termo)
+        self.termos = list(dict.fromkeys(self.por_nome.values()))
+
+        # Palavras de cada termo ("colesterol", "hdl") e a forma compacta das siglas ("v.c.m" -> "vcm"),
+        # para achar candidatos mesmo quando o laudo escreve o nome de outro jeito; os sinônimos
+        # das descrições ("eritrócitos" para "hemacias") entram do mesmo modo
+        self._termos_por_palavra: dict[str, set[str]] = {}
+        nomes_e_termos = list(self.por_nome.items())
+        for termo, apelidos in (sinonimos or {}).items():
+            nomes_e_termos.extend((normalizar(apelido), termo) for apelido in apelidos)
+        for nome, termo in nomes_e_termos:
+            palavras = {p for p in re.findall(r"\w+", nome) if len(p) >= 3 and p not in PALAVRAS_SEM_PESO}
+            compacto = re.sub(r"\W+", "", nome)
+            if len(compacto) >= 2:
+                palavras.add(compacto)
+            for palavra in palavras:
+                self._termos_por_palavra.setdefault(palavra, set()).add(termo)
+
+        alternativas = "|".join(re.escape(nome) for nome in sorted(self.por_nome, key=len, reverse=True))
+        self._re_termo = re.compile(rf"(?<![\w.])(?:{alternativas})(?!\w)")
+
+    def resolver_rotulo(self, rotulo: str) -> str | None:
+        """
+        Retorna a chave do glossário quando o rótulo é o próprio termo (ignorando caixa, acentos,
+        pontuação final e prefixos como "Contagem de"), ou None. Rótulos que só terminam com um termo ("Volume médio de
+        plaquetas", "Clearance de creatinina") são outros exames: ficam para o extrator com IA.
+        """
+        nome = normalizar(rotulo)
+        if nome in self.por_nome:
+            return self.por_nome[nome]
+        nome = nome.rstrip(". ")
+        for prefixo in PREFIXOS_NEUTROS:
+            if nome.startswith(prefixo):
+                nome = nome[len(prefixo):]
+                break
+        return self.por_nome.get(nome)
+
+    def contem_termo(self, rotulo: str) -> bool:
+        return self._re_termo.search(normalizar(rotulo)) is not None
+
+    def encontrar_termos(self, texto: str) -> set[str]:
+        """Todas as chaves do glossário presentes no texto, em uma única varredura."""
+        return {self.por_nome[m.group(0)] for m in self._re_termo.finditer(normalizar(texto))}
+
+    def _candidatos(self, texto: str) -> set[str]:
+        nome = normalizar(texto)
+        candidatos = {self.por_nome[m.group(0)] for m in self._re_termo.finditer(nome)}
+        for palavra in set(re.findall(r"\w+", nome)):
+            candidatos.update(self._termos_por_palavra.get(palavra, ()))
+        return candidatos
+
+    def termos_candidatos(self, texto: str) -> list[str] | None:
+        """
+        Termos que podem aparecer no texto, na ordem do glossário: os encontrados por inteiro
+        mais, como margem de segurança, os que compartilham alguma palavra ou sigla com o texto.
+        Retorna None quando alguma linha com cara de resultado ("Glicose: 90 mg/dL") não tem
+        nenhum candidato: o nome está escrito de um jeito que o índice não conhece, e só o
+        glossário inteiro garante que o termo certo vá para o prompt.
+        """
+        for linha in texto.splitlines():
+            lido = _ler_linha_unica(linha.strip())
+            if lido is None:
+                continue
+            rotulo, _, unidade, com_dois_pontos = lido
+            if _eh_rotulo_ignorado(rotulo) or not (com_dois_pontos or _parece_linha_de_resultado(rotulo, unidade)):
+                continue
+            if not self._candidatos(rotulo):
+                return None
+        candidatos = self._candidatos(texto)
+        return [termo for termo in self.termos if termo in candidatos]
+
+
+def _eh_titulo(linha: str) -> bool:
+    # Tolera siglas com minúsculas, como em "HEMOGLOBINA GLICADA HbA1c"
+    letras = [c for c in linha if c.isalpha()]
+    maiusculas = sum(1 for c in letras if c.isupper())
+    return len(letras) >= 4 and maiusculas >= 0.85 * len(letras) and not linha.endswith(":")
+
+
+def _eh_rotulo_ignorado(rotulo: str) -> bool:
+    nome = normalizar(rotulo).strip(" .*")
+    return not nome or len(nome) > 60 or nome.startswith(ROTULOS_IGNORADOS)
+
+
+def _parece_linha_de_resultado(rotulo: str, unidade: str) -> bool:
+    """
+    Linhas sem dois-pontos só viram pendência no formato 'Nome do exame valor unidade':
+    faixas de referência ("4,50 a 6,10"), citações e frases explicativas ficam de fora.
+    """
+    return (
+        rotulo[:1].isalpha()
+        and len(rotulo.split()) <= 6
+        and "," not in rotulo
+        and bool(unidade)
+        and ("/" in unidade or "%" in unidade or len(unidade) <= 4)
+    )
+
+
+def _ler_unidade(token: str | None) -> str:
+    if token and RE_UNIDADE.match(token) and not RE_VALOR.match(token):
+        return token
+    return ""
+
+
+def _ler_linha_unica(linha: str):
+    """Lê formatos em uma linha: 'Rótulo: 12,1 g/dL ...' ou 'Rótulo 12,1 g/dL 12,0 a 15,8'."""
+    if ":" in linha:
+        rotulo, resto = linha.split(":", 1)
+        tokens = resto.split()
+        if not tokens or not RE_VALOR.match(tokens[0]):
+            return None
+        valor, depois = tokens[0], resto.strip()[len(tokens[0]):]
+        unidade = _ler_unidade(tokens[1] if len(tokens) > 1 else None)
+        com_dois_pontos = True
+    else:
+        tokens = linha.split()
+        posicao = next((k for k, t in enumerate(tokens) if k > 0 and RE_VALOR.match(t)), None)
+        if posicao is None:
+            return None
+        rotulo, valor = " ".join(tokens[:posicao]), tokens[posicao]
+        depois = " ".join(tokens[posicao + 1:])
+        unidade = _ler_unidade(tokens[posicao + 1] if len(tokens) > posicao + 1 else None)
+        com_dois_pontos = False
+
+    # "170 a 199 mg/dL" é uma faixa de referência, não um resultado
+    if RE_FAIXA.match(depois) or not any(c.isalpha() for c in rotulo):
+        return None
+    return rotulo.strip(), valor, unidade, com_dois_pontos
+
+
+def extrair_localmente(texto: str, indice: IndiceTermos) -> tuple[list[dict], list[tuple[str, str]]]:
+    """
+    Extrai os resultados do texto do PyPDF2 sem usar IA.
+
+    Retorna os grupos no mesmo formato do extrator com IA e a lista de pendências
+    (seção, linha) que parecem resultados mas não puderam ser resolvidas localmente.
+    """
+    linhas = [linha.strip() for linha in texto.splitlines()]
+    linhas = [linha for linha in linhas if linha]
+
+    grupos: dict[str, list[dict]] = {}
+    # (grupo, exame) -> (resultado, seção, linha de origem); o mesmo exame pode aparecer em
+    # painéis diferentes (hemoglobina na urina e no hemograma)
+    vistos: dict[tuple[str, str], tuple[dict, str, str]] = {}
+    conflitantes = set()
+    pendencias = []
+    secao = ""
+
+    def adicionar(grupo, exame, valor, unidade, origem):
+        chave = (grupo, exame)
+        if chave in conflitantes:
+            pendencias.append((secao, origem))
+            return
+        if chave in vistos:
+            anterior, secao_anterior, origem_anterior = vistos[chave]
+            if (anterior["valor"], anterior["unidade"]) == (valor, unidade):
+                return
+            # Dois valores para o mesmo exame na mesma seção: o parser não sabe qual é o
+            # resultado, então as duas linhas vão para o extrator com IA
+            grupos[grupo].remove(anterior)
+            conflitantes.add(chave)
+            pendencias.extend([(secao_anterior, origem_anterior), (secao, origem)])
+            return
+        resultado = {"exame": exame, "valor": valor, "unidade": unidade}
+        vistos[chave] = (resultado, secao, origem)
+        grupos.setdefault(grupo, []).append(resultado)
+
+    i = 0
+    while i < len(linhas):
+        linha = linhas[i]
+        anterior = linhas[i - 1] if i > 0 else ""
+
+        if _eh_titulo(linha) and not anterior.endswith(":"):
+            secao = linha
+            i += 1
+            continue
+
+        if linha.endswith(":") and i + 1 < len(linhas) and RE_VALOR.match(linhas[i + 1]):
+            # Formato em várias linhas: "Rótulo:" / "valor" / "unidade"
+            unidade = _ler_unidade(linhas[i + 2] if i + 2 < len(linhas) else None)
+            lido = (linha[:-1].strip(), linhas[i + 1], unidade, True)
+            i += 3 if unidade else 2
+        else:
+            lido = _ler_linha_unica(linha)
+            i += 1
+
+        if lido is None:
+            continue
+
+        rotulo, valor, unidade, com_dois_pontos = lido
+        grupo = secao.title() if secao else GRUPO_SEM_TITULO
+
+        if normalizar(rotulo) == "resultado":
+            # Seções de um único exame: o nome do exame é o título da seção
+            exame = indice.resolver_rotulo(secao) if secao else None
+            origem = f"{secao}: {valor} {unidade}".strip()
+            if exame:
+                adicionar(GRUPO_SECOES_AVULSAS, exame, valor, unidade, origem)
+            elif secao:
+                pendencias.append((secao, origem))
+            continue
+
+        # No formato em várias linhas, a linha atual é só o rótulo: remonta "Rótulo: valor unidade"
+        origem = f"{rotulo}: {valor} {unidade}".strip() if linha.endswith(":") else linha
+        exame = indice.resolver_rotulo(rotulo)
+        if exame:
+            adicionar(grupo, exame, valor, unidade, origem)
+        elif not _eh_rotulo_ignorado(rotulo) and (com_dois_pontos or _parece_linha_de_resultado(rotulo, unidade)):
+            # Qualquer linha com cara de resultado e nome não resolvido ("Creatinina sérica 0,9 mg/dL",
+            # "TSH ultrassensível: 2,1") vai para o extrator com IA, com ou sem dois-pontos
+            pendencias.append((secao, origem))
+
+    resultado = [{"grupo": nome, "resultados": resultados} for nome, resultados in grupos.items()]
+    return resultado, pendencias
+
+
+def texto_das_pendencias(pendencias: list[tuple[str, str]]) -> str:
+    """Monta um texto curto só com as linhas pendentes, agrupadas pela seção de origem."""
+    partes = []
+    secao_atual = None
+    for secao, linha in pendencias:
+        if secao != secao_atual:
+            if secao:
+                partes.append(secao)
+            secao_atual = secao
+        partes.append(linha)
+    return "\n".join(partes)
+
+
+def mesclar_grupos(grupos_base: list[dict], grupos_extra: list[dict]) -> list[dict]:
+    """
+    Acrescenta os grupos extras aos grupos base, sem repetir grupos nem um exame dentro do mesmo
+    grupo. O mesmo exame em grupos diferentes (hemoglobina na urina e no hemograma) fica nos dois.
+    """
+    mesclados = [{"grupo": g.get("grupo", ""), "resultados": list(g.get("resultados", []))} for g in grupos_base]
+    por_nome = {normalizar(g["grupo"]): g for g in mesclados}
+    exames_vistos = {(normalizar(g["grupo"]), normalizar(r.get("exame", ""))) for g in mesclados for r in g["resultados"]}
+
+    for grupo in grupos_extra:
+        chave = normalizar(grupo.get("grupo", ""))
+        novos = []
+        for resultado in grupo.get("resultados", []):
+            nome = normalizar(resultado.get("exame", ""))
+            if nome and (chave, nome) not in exames_vistos:
+                exames_vistos.add((chave, nome))
+                novos.append(resultado)
+        if not novos:
+            continue
+        if chave in por_nome:
+            por_nome[chave]["resultados"].extend(novos)
+        else:
+            destino = {"grupo": grupo.get("grupo", "Grupo Desconhecido"), "resultados": novos}
+            mesclados.append(destino)
+            por_nome[chave] = destino
+    return mesclados
@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Métricas no formato de texto do Prometheus, sem dependências externas. Os valores são
+# por processo: com vários workers, cada um expõe os seus e o Prometheus soma.
+SERVER_TIMING_ATIVO = os.getenv("MEDBOT_SERVER_TIMING", "0") == "1"
+
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_metricas = []
+_coletores = []
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_rotulos(nomes, valores, extra=None) -> str:
+    pares = list(zip(nomes, valores)) + ([extra] if extra else [])
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{nome}="{_escapar(valor)}"' for nome, valor in pares) + "}"
+
+
+class Contador:
+    """Contador monotônico com rótulos."""
+
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple[str, ...] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self._valores: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+        _metricas.append(self)
+
+    def inc(self, *valores_rotulos, valor: float = 1) -> None:
+        with self._lock:
+            self._valores[valores_rotulos] = self._valores.get(valores_rotulos, 0) + valor
+
+    def linhas(self):
+        with self._lock:
+            itens = sorted(self._valores.items())
+        for valores, total in itens:
+            yield f"{self.nome}{_formatar_rotulos(self.rotulos, valores)} {total:g}"
+
+
+class Histograma:
+    """Histograma com baldes cumulativos, soma e contagem por combinação de rótulos."""
+
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple[str, ...] = (), limites=LIMITES_SEGUNDOS):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = rotulos
+        self.limites = tuple(limites)
+        self._series: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        _metricas.append(self)
+
+    def observar(self, valor: float, *valores_rotulos) -> None:
+        with self._lock:
+            serie = self._series.get(valores_rotulos)
+            if serie is None:
+                serie = self._series[valores_rotulos] = [[0] * len(self.limites), 0.0, 0]
+            for i, limite in enumerate(self.limites):
+                if valor <= limite:
+                    serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def linhas(self):
+        with self._lock:
+            itens = sorted((valores, (list(baldes), soma, total)) for valores, (baldes, soma, total) in self._series.items())
+        for valores, (baldes, soma, total) in itens:
+            for limite, quantidade in zip(self.limites, baldes):
+                yield f"{self.nome}_bucket{_formatar_rotulos(self.rotulos, valores, ('le', f'{limite:g}'))} {quantidade}"
+            yield f"{self.nome}_bucket{_formatar_rotulos(self.rotulos, valores, ('le', '+Inf'))} {total}"
+            yield f"{self.nome}_sum{_formatar_rotulos(self.rotulos, valores)} {soma:.6f}"
+            yield f"{self.nome}_count{_formatar_rotulos(self.rotulos, valores)} {total}"
+
+
+def registrar_coletor(funcao) -> None:
+    """
+    Registra uma função chamada a cada leitura do /metrics. Ela devolve tuplas
+    (nome, tipo, ajuda, [(rotulos: dict, valor), ...]) com valores lidos na hora (ex: caches).
+    """
+    _coletores.append(funcao)
+
+
+def renderizar() -> str:
+    """Todas as métricas no formato de exposição de texto do Prometheus."""
+    linhas = []
+    for metrica in _metricas:
+        linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+        linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+        linhas.extend(metrica.linhas())
+    for coletor in _coletores:
+        try:
+            familias = list(coletor())
+        except Exception as e:
+            print(f"Erro ao coletar métricas: {e}")
+            continue
+        for nome, tipo, ajuda, amostras in familias:
+            linhas.append(f"# HELP {nome} {ajuda}")
+            linhas.append(f"# TYPE {nome} {tipo}")
+            for rotulos, valor in amostras:
+                linhas.append(f"{nome}{_formatar_rotulos(tuple(rotulos), tuple(rotulos.values()))} {valor:g}")
+    return "\n".join(linhas) + "\n"
+
+
+# --- Métricas do pipeline ---
+etapa_segundos = Histograma("medbot_etapa_segundos", "Duração de cada etapa do pipeline.", ("etapa",))
+requisicao_segundos = Histograma("medbot_requisicao_segundos", "Duração das requisições HTTP (até o início da resposta).", ("rota", "metodo", "status"))
+llm_segundos = Histograma("medbot_llm_segundos", "Latência das chamadas ao modelo, incluindo novas tentativas.", ("modelo", "tipo"))
+llm_chamadas = Contador("medbot_llm_chamadas_total", "Chamadas ao modelo por resultado.", ("modelo", "tipo", "resultado"))
+llm_novas_tentativas = Contador("medbot_llm_novas_tentativas_total", "Novas tentativas após erros transitórios.", ("modelo", "tipo"))
+llm_tokens = Contador("medbot_llm_tokens_total", "Tokens consumidos, informados pela API.", ("modelo", "tipo", "direcao"))
+triagem_documentos = Contador("medbot_triagem_documentos_total", "Decisões da triagem de documentos antes da extração.", ("decisao", "motivo"))
+
+# Tempos das etapas da requisição atual, para o cabeçalho Server-Timing
+_tempos_requisicao: ContextVar[dict | None] = ContextVar("tempos_requisicao", default=None)
+
+
+def iniciar_requisicao() -> dict:
+    """Começa a acumular os tempos de etapa desta requisição (e das tarefas criadas a partir dela)."""
+    tempos = {}
+    _tempos_requisicao.set(tempos)
+    return tempos
+
+
+@contextmanager
+def medir(etapa: str):
+    """Mede um trecho do pipeline, tanto no histograma quanto nos tempos da requisição atual."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        etapa_segundos.observar(duracao, etapa)
+        tempos = _tempos_requisicao.get()
+        if tempos is not None:
+            tempos[etapa] = tempos.get(etapa, 0.0) + duracao
+
+
+def server_timing(tempos: dict) -> str:
+    """Monta o valor do cabeçalho Server-Timing (durações em milissegundos)."""
+    return ", ".join(f"{etapa};dur={duracao * 1000:.1f}" for etapa, duracao in tempos.items())
@@ -0,0 +1,220 @@
+import asyncio
+import io
+import mmap
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import PyPDF2
+
+# Extração de texto fora do event loop: as páginas são lidas em paralelo num pool de processos
+PDF_WORKERS = int(os.getenv("MEDBOT_PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_MAX_PAGINAS = int(os.getenv("MEDBOT_PDF_MAX_PAGINAS", "60"))
+PDF_TIMEOUT_SEGUNDOS = float(os.getenv("MEDBOT_PDF_TIMEOUT", "30"))
+PDF_PAGINAS_POR_TAREFA = int(os.getenv("MEDBOT_PDF_PAGINAS_POR_TAREFA", "4"))
+# Depois do prazo, quanto tempo uma tarefa em andamento tem para parar sozinha (o prazo é
+# conferido entre as páginas) antes de o processo que a executa ser encerrado
+PDF_FOLGA_SEGUNDOS = float(os.getenv("MEDBOT_PDF_FOLGA", "2"))
+
+# Separa as páginas no texto extraído, para que as etapas seguintes possam dividir o documento por página
+SEPARADOR_PAGINAS = "\f"
+
+_pool = None
+
+
+class LimitePdfExcedido(Exception):
+    """O documento passou do limite de páginas ou de tempo de leitura."""
+
+
+def _mensagem_prazo() -> str:
+    return f"A leitura do PDF passou do limite de {PDF_TIMEOUT_SEGUNDOS:g} segundos."
+
+
+def _laco_do_processo(conexao) -> None:
+    """Corpo de um processo leitor: executa as tarefas recebidas pelo pipe, uma de cada vez."""
+    while True:
+        try:
+            tarefa = conexao.recv()
+        except EOFError:
+            return
+        if tarefa is None:
+            return
+        funcao, args = tarefa
+        try:
+            resposta = (True, funcao(*args))
+        except Exception as e:
+            resposta = (False, e)
+        try:
+            conexao.send(resposta)
+        except Exception:
+            # Resultado ou exceção que não pode ser serializado chega como texto
+            conexao.send((False, RuntimeError(repr(resposta[1]))))
+
+
+class _ProcessoLeitor:
+    """Processo dedicado à leitura de PDFs, ligado por um pipe à thread do pool que o usa."""
+
+    def __init__(self):
+        self.conexao, conexao_filho = multiprocessing.Pipe()
+        self.processo = multiprocessing.Process(target=_laco_do_processo, args=(conexao_filho,), daemon=True)
+        self.processo.start()
+        conexao_filho.close()
+
+    def encerrar(self) -> None:
+        if self.processo.is_alive():
+            self.processo.kill()
+        self.processo.join(timeout=1)
+        self.conexao.close()
+
+
+class PoolDeLeitura:
+    """
+    Pool de leitura de PDFs: cada uma das `tamanho` threads tem o seu próprio processo leitor
+    e espera a resposta dele até o prazo da tarefa (mais a folga). Uma tarefa presa numa página
+    encerra só o processo que a executa; as leituras dos outros PDFs seguem nos demais, e a
+    thread cria um processo novo na próxima tarefa.
+    """
+
+    def __init__(self, tamanho: int):
+        self._threads = ThreadPoolExecutor(max_workers=tamanho, thread_name_prefix="leitor-pdf")
+        self._local = threading.local()
+        self._processos: set[_ProcessoLeitor] = set()
+        self._lock = threading.Lock()
+        self._encerrado = False
+        self.reciclados = 0
+
+    def _processo_da_thread(self) -> _ProcessoLeitor:
+        processo = getattr(self._local, "processo", None)
+        if processo is None:
+            processo = _ProcessoLeitor()
+            with self._lock:
+                self._processos.add(processo)
+            self._local.processo = processo
+        return processo
+
+    def _descartar(self, processo: _ProcessoLeitor) -> None:
+        with self._lock:
+            self._processos.discard(processo)
+        processo.encerrar()
+        self._local.processo = None
+
+    def _rodar(self, funcao, args: tuple, prazo: float):
+        for tentativa in range(2):
+            if self._encerrado:
+                raise RuntimeError("O pool de leitura de PDFs foi encerrado.")
+            # Tarefa que esperou na fila até depois do prazo nem chega a um processo
+            if time.time() > prazo:
+                raise LimitePdfExcedido(_mensagem_prazo())
+            processo = self._processo_da_thread()
+            try:
+                processo.conexao.send((funcao, args))
+                if not processo.conexao.poll(max(0.0, prazo + PDF_FOLGA_SEGUNDOS - time.time())):
+                    print("Leitura de PDF passou do prazo; reiniciando o processo leitor.")
+                    self._descartar(processo)
+                    self.reciclados += 1
+                    raise LimitePdfExcedido(_mensagem_prazo())
+                ok, resultado = processo.conexao.recv()
+            except (EOFError, OSError):
+                # O processo morreu (ex: falta de memória): tenta mais uma vez num processo novo
+                self._descartar(processo)
+                if tentativa:
+                    raise
+                continue
+            if ok:
+                return resultado
+            raise resultado
+
+    async def executar(self, funcao, *args, prazo: float):
+        """Roda `funcao(*args)` num processo leitor; passado `prazo` + folga, o processo é encerrado."""
+        return await asyncio.get_running_loop().run_in_executor(self._threads, self._rodar, funcao, args, prazo)
+
+    def encerrar(self) -> None:
+        self._encerrado = True
+        self._threads.shutdown(wait=False, cancel_futures=True)
+        with self._lock:
+            processos, self._processos = list(self._processos), set()
+        for processo in processos:
+            processo.encerrar()
+
+
+def _obter_pool() -> PoolDeLeitura | None:
+    global _pool
+    if _pool is None and PDF_WORKERS > 0:
+        _pool = PoolDeLeitura(PDF_WORKERS)
+    return _pool
+
+
+def encerrar_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.encerrar()
+        _pool = None
+
+
+@contextmanager
+def _abrir(fonte: bytes | Path):
+    """
+    Stream de leitura do PDF. Um caminho é mapeado em memória (as páginas vêm do cache de
+    disco do sistema, compartilhado entre os processos); bytes são lidos sem cópia.
+    """
+    if isinstance(fonte, (bytes, bytearray)):
+        yield io.BytesIO(fonte)
+        return
+    with open(fonte, "rb") as arquivo, mmap.mmap(arquivo.fileno(), 0, access=mmap.ACCESS_READ) as mapa:
+        yield mapa
+
+
+def contar_paginas(fonte: bytes | Path) -> int:
+    with _abrir(fonte) as stream:
+        return len(PyPDF2.PdfReader(stream).pages)
+
+
+def extrair_paginas(fonte: bytes | Path, inicio: int, fim: int, prazo: float | None = None) -> str:
+    """
+    Extrai o texto das páginas [inicio, fim). Roda dentro de um processo leitor e para
+    entre uma página e outra quando passa do `prazo` (horário absoluto, em time.time()).
+    """
+    with _abrir(fonte) as stream:
+        paginas = PyPDF2.PdfReader(stream).pages
+        textos = []
+        for i in range(inicio, fim):
+            if prazo is not None and time.time() > prazo:
+                raise LimitePdfExcedido(_mensagem_prazo())
+            textos.append(paginas[i].extract_text() or "")
+        return SEPARADOR_PAGINAS.join(textos)
+
+
+async def _executar(funcao, *args, prazo: float):
+    """Roda a função num processo leitor (ou numa thread, sem pool, onde o prazo só vale entre as páginas)."""
+    pool = _obter_pool()
+    if pool is None:
+        return await asyncio.to_thread(funcao, *args)
+    return await pool.executar(funcao, *args, prazo=prazo)
+
+
+async def extrair_texto_pdf(fonte: bytes | Path) -> str:
+    """
+    Extrai o texto do PDF sem bloquear o event loop, respeitando os limites de páginas e de tempo.
+    `fonte` pode ser o conteúdo ou o caminho do arquivo; com o caminho, os processos leitores
+    recebem só o nome do arquivo em vez de uma cópia dos bytes por tarefa.
+    """
+    prazo = time.time() + PDF_TIMEOUT_SEGUNDOS
+
+    async def _extrair():
+        total = await _executar(contar_paginas, fonte, prazo=prazo)
+        if total > PDF_MAX_PAGINAS:
+            raise LimitePdfExcedido(f"O PDF tem {total} páginas; o limite é {PDF_MAX_PAGINAS}.")
+        faixas = [(inicio, min(inicio + PDF_PAGINAS_POR_TAREFA, total)) for inicio in range(0, total, PDF_PAGINAS_POR_TAREFA)]
+        partes = await asyncio.gather(*(_executar(extrair_paginas, fonte, inicio, fim, prazo, prazo=prazo) for inicio, fim in faixas))
+        return SEPARADOR_PAGINAS.join(partes)
+
+    # As tarefas na fila são canceladas; as que já estão num processo param no próximo intervalo
+    # entre páginas ou, presas numa página, têm o processo encerrado pela thread que as espera
+    try:
+        return await asyncio.wait_for(_extrair(), timeout=PDF_TIMEOUT_SEGUNDOS)
+    except asyncio.TimeoutError:
+        raise LimitePdfExcedido(_mensagem_prazo())
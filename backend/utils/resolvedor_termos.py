@@ -0,0 +1,255 @@
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from functools import cache
+
+try:
+    import numpy as np
+except ImportError:  # NumPy é opcional: sem ele a busca percorre os vetores esparsos em Python
+    np = None
+
+from utils.glossario import obter_glossario
+from utils.local_parser import PALAVRAS_SEM_PESO, normalizar, sinonimos_da_descricao
+from utils.metricas import registrar_coletor
+
+# Resolve localmente nomes de exames que não são chaves do glossário ("Glicose em jejum",
+# "Colesterol LDL calculado", "T4 Livre") para a entrada mais parecida, com TF-IDF de
+# n-gramas de caracteres e similaridade de cosseno. Nomes quase tão parecidos com duas
+# entradas diferentes (ex: só "Colesterol") ficam sem resolução.
+RESOLVEDOR_ATIVO = os.getenv("MEDBOT_RESOLVEDOR_TERMOS", "1") == "1"
+RESOLVEDOR_LIMIAR = float(os.getenv("MEDBOT_RESOLVEDOR_LIMIAR", "0.55"))
+RESOLVEDOR_MARGEM = float(os.getenv("MEDBOT_RESOLVEDOR_MARGEM", "0.08"))
+RESOLVEDOR_CACHE_MAX = int(os.getenv("MEDBOT_RESOLVEDOR_CACHE_MAX", "4096"))
+
+TAMANHOS_NGRAMA = (3, 4)
+# Qualificadores que os laudos acrescentam ao nome do exame e que não mudam a referência
+QUALIFICADORES = {
+    "serico", "serica", "soro", "plasma", "plasmatico", "plasmatica", "sangue", "total", "totais",
+    "calculado", "calculada", "estimado", "estimada", "dosagem", "contagem", "automatizado", "automatizada",
+}
+# A descrição entra com peso menor que o nome: cobre nomes por extenso ("Volume Corpuscular
+# Médio") sem deixar que palavras comuns das descrições decidam sozinhas
+PESO_DESCRICAO = 0.35
+
+
+def _caracteristicas(texto: str) -> Counter:
+    """N-gramas de caracteres de cada palavra, com as bordas marcadas (" vcm " -> " vc", "vcm", "cm ", " vcm", ...)."""
+    # "V.C.M." e "VCM" viram a mesma sigla; hífens, barras e parênteses separam palavras
+    palavras = re.findall(r"\w+", normalizar(texto).replace(".", ""))
+    contagem = Counter()
+    for palavra in palavras:
+        if palavra in PALAVRAS_SEM_PESO:
+            continue
+        marcada = f" {palavra} "
+        for tamanho in TAMANHOS_NGRAMA:
+            for i in range(len(marcada) - tamanho + 1):
+                contagem[marcada[i:i + tamanho]] += 1
+    return contagem
+
+
+def _forma_compacta(texto: str) -> str:
+    return re.sub(r"\W+", "", normalizar(texto))
+
+
+def _palavras(texto: str) -> list[str]:
+    return re.findall(r"\w+", normalizar(texto).replace(".", ""))
+
+
+def _distintivos(nome: str) -> set[str]:
+    """
+    Palavras curtas que separam exames de nomes quase iguais: letras soltas e tudo que tem
+    dígito ("Vitamina A" x "Vitamina D", "B1" x "B12", "1,25" x "25"). O "e" entre duas
+    palavras é conjunção, não a vitamina.
+    """
+    palavras = _palavras(nome)
+    return {
+        palavra for i, palavra in enumerate(palavras)
+        if (len(palavra) == 1 or any(c.isdigit() for c in palavra))
+        and not (palavra in PALAVRAS_SEM_PESO and 0 < i < len(palavras) - 1)
+    }
+
+
+def _sem_qualificadores(nome: str) -> str:
+    """'Creatinina sérica' -> 'creatinina'; o nome fica como está se só tiver qualificadores."""
+    palavras = [p for p in re.findall(r"[\w.]+", nome) if p not in QUALIFICADORES]
+    return " ".join(palavras) or nome
+
+
+class ResolvedorTermos:
+    """
+    Índice TF-IDF montado uma vez a partir das chaves e descrições do glossário. Cada chave
+    e cada sinônimo citado na descrição é uma linha da matriz (normalizada), e a busca de
+    um lote de nomes é um único produto de matrizes. As resoluções ficam num cache LRU
+    por nome normalizado.
+    """
+
+    def __init__(self, glossario: dict):
+        self.chaves = list(glossario)
+        self._por_forma_compacta = {}
+        for chave in self.chaves:
+            self._por_forma_compacta.setdefault(_forma_compacta(chave), chave)
+        # Chaves com o mesmo conteúdo ("vcm", "v.c.m") são sinônimos, não concorrentes
+        conteudos = {}
+        entrada_da_chave = {c: conteudos.setdefault(json.dumps(glossario[c], sort_keys=True), len(conteudos)) for c in self.chaves}
+
+        # Linhas: a própria chave (com a descrição, de peso menor) e cada sinônimo da descrição
+        self._chave_da_linha = []
+        nomes, descricoes = [], []
+        for chave in self.chaves:
+            descricao = glossario[chave].get("descricao", "")
+            for nome in [chave, *sinonimos_da_descricao(descricao)]:
+                self._chave_da_linha.append(chave)
+                nomes.append(_caracteristicas(nome))
+                descricoes.append(_caracteristicas(descricao) if nome == chave else Counter())
+        self._entrada = [entrada_da_chave[chave] for chave in self._chave_da_linha]
+        # Palavras de todos os nomes de cada entrada, também juntas duas a duas ("t4 l" -> "t4l"),
+        # para conferir os distintivos da consulta
+        self._vocabulario: dict[int, set[str]] = {}
+        for chave in self.chaves:
+            for nome in [chave, *sinonimos_da_descricao(glossario[chave].get("descricao", ""))]:
+                palavras = _palavras(nome)
+                self._vocabulario.setdefault(entrada_da_chave[chave], set()).update(
+                    palavras, (a + b for a, b in zip(palavras, palavras[1:]))
+                )
+        documentos = nomes + [_caracteristicas(glossario[chave].get("descricao", "")) for chave in self.chaves]
+        frequencia = Counter(caracteristica for doc in documentos for caracteristica in doc)
+        self._idf = {c: math.log((1 + len(documentos)) / (1 + df)) + 1 for c, df in frequencia.items()}
+        # N-gramas que não aparecem no glossário ainda contam na norma da consulta
+        self._idf_desconhecido = math.log(1 + len(documentos)) + 1
+
+        linhas = []
+        for nome, descricao in zip(nomes, descricoes):
+            vetor = self._ponderar(nome)
+            for caracteristica, peso in self._ponderar(descricao).items():
+                vetor[caracteristica] = vetor.get(caracteristica, 0.0) + PESO_DESCRICAO * peso
+            linhas.append(self._normalizar_vetor(vetor))
+        self._linhas = linhas
+
+        if np is not None:
+            self._colunas = {c: i for i, c in enumerate(self._idf)}
+            self._matriz = np.zeros((len(linhas), len(self._colunas)), dtype=np.float32)
+            for i, vetor in enumerate(linhas):
+                for caracteristica, peso in vetor.items():
+                    self._matriz[i, self._colunas[caracteristica]] = peso
+
+        self._cache: OrderedDict[str, tuple[str | None, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._metricas = {"consultas": 0, "acertos_cache": 0, "resolvidos": 0, "nao_resolvidos": 0}
+
+    def _ponderar(self, contagem: Counter) -> dict[str, float]:
+        # Só as características conhecidas entram no vetor; na consulta, as demais entram só na norma
+        return {c: n * self._idf[c] for c, n in contagem.items() if c in self._idf}
+
+    @staticmethod
+    def _normalizar_vetor(vetor: dict[str, float]) -> dict[str, float]:
+        norma = math.sqrt(sum(peso * peso for peso in vetor.values()))
+        return {c: peso / norma for c, peso in vetor.items()} if norma else {}
+
+    def _vetor_consulta(self, nome: str) -> dict[str, float]:
+        contagem = _caracteristicas(nome)
+        vetor = self._ponderar(contagem)
+        desconhecidas = sum((n * self._idf_desconhecido) ** 2 for c, n in contagem.items() if c not in self._idf)
+        norma = math.sqrt(sum(peso * peso for peso in vetor.values()) + desconhecidas)
+        return {c: peso / norma for c, peso in vetor.items()} if norma else {}
+
+    def _similaridades(self, nomes: list[str]) -> list[list[float]]:
+        """Cosseno de cada nome com cada linha do índice."""
+        consultas = [self._vetor_consulta(nome) for nome in nomes]
+        if np is not None:
+            matriz_consultas = np.zeros((len(consultas), len(self._colunas)), dtype=np.float32)
+            for i, vetor in enumerate(consultas):
+                for caracteristica, peso in vetor.items():
+                    matriz_consultas[i, self._colunas[caracteristica]] = peso
+            return (matriz_consultas @ self._matriz.T).tolist()
+        return [
+            [sum(peso * linha.get(c, 0.0) for c, peso in consulta.items()) for linha in self._linhas]
+            for consulta in consultas
+        ]
+
+    def _escolher(self, similaridades: list[float], distintivos: set[str]) -> tuple[str | None, float]:
+        ordem = sorted(range(len(similaridades)), key=similaridades.__getitem__, reverse=True)
+        melhor = ordem[0]
+        segunda = next((similaridades[i] for i in ordem[1:] if self._entrada[i] != self._entrada[melhor]), 0.0)
+        pontuacao = similaridades[melhor]
+        # Os n-gramas quase não pesam letras e dígitos soltos: "Vitamina A" fica perto de
+        # "vitamina d", e só a conferência das palavras distintivas separa os dois
+        if (
+            pontuacao >= RESOLVEDOR_LIMIAR and pontuacao - segunda >= RESOLVEDOR_MARGEM
+            and distintivos <= self._vocabulario[self._entrada[melhor]]
+        ):
+            return self._chave_da_linha[melhor], pontuacao
+        return None, pontuacao
+
+    def resolver_lote(self, nomes: list[str]) -> list[str | None]:
+        """Chave do glossário mais próxima de cada nome, ou None quando não há uma confiável."""
+        normalizados = [normalizar(nome) for nome in nomes]
+        resolvidos = {}
+        with self._lock:
+            for nome in normalizados:
+                if nome in self._cache:
+                    self._cache.move_to_end(nome)
+                    resolvidos[nome] = self._cache[nome]
+            self._metricas["consultas"] += len(normalizados)
+            self._metricas["acertos_cache"] += sum(1 for nome in normalizados if nome in resolvidos)
+
+        faltantes = [nome for nome in dict.fromkeys(normalizados) if nome not in resolvidos]
+        novos = {}
+        busca = []
+        for nome in faltantes:
+            consulta = _sem_qualificadores(nome)
+            # Mesma sigla ou mesmo nome escrito com outra pontuação ("V.C.M", "TSH-") não precisa da busca
+            exata = self._por_forma_compacta.get(_forma_compacta(nome)) or self._por_forma_compacta.get(_forma_compacta(consulta))
+            if exata is not None:
+                novos[nome] = (exata, 1.0)
+            elif _caracteristicas(consulta):
+                busca.append((nome, consulta))
+            else:
+                novos[nome] = (None, 0.0)
+        if busca:
+            for (nome, consulta), similaridades in zip(busca, self._similaridades([consulta for _, consulta in busca])):
+                novos[nome] = self._escolher(similaridades, _distintivos(consulta))
+
+        if novos:
+            with self._lock:
+                for nome, resolucao in novos.items():
+                    self._cache[nome] = resolucao
+                    self._metricas["resolvidos" if resolucao[0] else "nao_resolvidos"] += 1
+                while len(self._cache) > RESOLVEDOR_CACHE_MAX:
+                    self._cache.popitem(last=False)
+            resolvidos.update(novos)
+        return [resolvidos[nome][0] for nome in normalizados]
+
+    def resolver(self, nome: str) -> str | None:
+        return self.resolver_lote([nome])[0]
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            return {**self._metricas, "itens_cache": len(self._cache), "numpy": np is not None}
+
+
+@cache
+def obter_resolvedor() -> ResolvedorTermos:
+    """Resolvedor montado uma vez por processo, na primeira consulta (ou no aquecimento)."""
+    return ResolvedorTermos(obter_glossario())
+
+
+def estatisticas_resolvedor() -> dict:
+    return obter_resolvedor().estatisticas()
+
+
+def _coletar_metricas_resolvedor():
+    # Sem consultas ainda, não vale montar o índice só para expor zeros
+    if obter_resolvedor.cache_info().currsize == 0:
+        return
+    metricas = estatisticas_resolvedor()
+    yield ("medbot_resolvedor_termos_total", "counter", "Nomes de exames fora do glossário resolvidos localmente.", [
+        ({"resultado": "resolvido"}, metricas["resolvidos"]),
+        ({"resultado": "nao_resolvido"}, metricas["nao_resolvidos"]),
+        ({"resultado": "cache"}, metricas["acertos_cache"]),
+    ])
+
+
+registrar_coletor(_coletar_metricas_resolvedor)
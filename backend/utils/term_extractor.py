@@ -1,13 +1,6 @@
-import os
 import json
-from dotenv import load_dotenv
-from openai import AsyncOpenAI
 
-# Carrega variáveis de ambiente
-load_dotenv()
-
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-client = AsyncOpenAI(api_key=OPENAI_API_KEY)
+from utils.llm_client import completar, chave_configurada
 
 PROMPT_TEMPLATE = """
 Você é um especialista em terminologia médica e sua única tarefa é analisar um texto
@@ -25,10 +18,10 @@ Texto para análise:
 """
 
 async def extract_medical_terms(text: str) -> list[str]:
-    if not OPENAI_API_KEY:
+    if not chave_configurada():
         raise ValueError("A chave da API da OpenAI não foi encontrada. Verifique o arquivo .env")
 
-    resp = await client.chat.completions.create(
+    content = await completar(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "Você é um especialista em terminologia médica."},
@@ -36,16 +29,16 @@ async def extract_medical_terms(text: str) -> list[str]:
         ],
         temperature=0.1,
         response_format={"type": "json_object"},
+        tipo="termos",
     )
 
-    content = resp.choices[0].message.content
     data = json.loads(content)
     return data.get("termos", [])
 
 
 async def validate_document_context(text: str) -> bool:
     """Classifica se o texto é (SIM) um documento da área da saúde."""
-    if not OPENAI_API_KEY:
+    if not chave_configurada():
         return False
 
     prompt = f"""
@@ -59,14 +52,15 @@ async def validate_document_context(text: str) -> bool:
     ---
     """
 
-    resp = await client.chat.completions.create(
+    content = await completar(
         model="gpt-4o-mini",
         messages=[
             {"role": "system", "content": "Você é um classificador de documentos médicos."},
             {"role": "user", "content": prompt},
         ],
         temperature=0,
+        tipo="validacao_documento",
     )
 
-    answer = resp.choices[0].message.content.strip().upper()
+    answer = content.strip().upper()
     return "SIM" in answer
\ No newline at end of file
@@ -0,0 +1,106 @@
+import os
+import re
+
+from utils.llm_client import chave_configurada
+from utils.local_parser import IndiceTermos, RE_UNIDADE, RE_VALOR, normalizar
+from utils.metricas import triagem_documentos
+from utils.term_extractor import validate_document_context
+
+# Triagem local antes do gpt-4o: notas fiscais, currículos e PDFs só com imagem são recusados
+# em milissegundos. Só os documentos com pontuação entre os dois limiares vão ao classificador
+# com gpt-4o-mini.
+TRIAGEM_ATIVA = os.getenv("MEDBOT_TRIAGEM", "1") == "1"
+TRIAGEM_LIMIAR_REJEITAR = float(os.getenv("MEDBOT_TRIAGEM_LIMIAR_REJEITAR", "0.25"))
+TRIAGEM_LIMIAR_ACEITAR = float(os.getenv("MEDBOT_TRIAGEM_LIMIAR_ACEITAR", "0.6"))
+TRIAGEM_MIN_CARACTERES = int(os.getenv("MEDBOT_TRIAGEM_MIN_CARACTERES", "80"))
+
+# Quantidades que já contam como "cara de laudo" com nota máxima em cada critério
+TERMOS_ESPERADOS = 4
+FRACAO_LINHAS_COM_VALOR_ESPERADA = 0.15
+PALAVRAS_DE_LAUDO = ("resultado", "referencia", "material", "metodo", "exame", "laudo", "coleta", "paciente")
+
+PESO_TERMOS = 0.5
+PESO_VALORES = 0.3
+PESO_PALAVRAS = 0.2
+
+
+class DocumentoRejeitado(Exception):
+    """O documento não parece ser um laudo de exames laboratoriais."""
+
+
+def _linha_com_valor(linha: str) -> bool:
+    """Linhas como 'Hemoglobina: 12,1 g/dL' ou '84 mg/dL': um número seguido de uma unidade."""
+    tokens = linha.replace(":", " ").split()
+    return any(
+        RE_VALOR.match(token) and RE_UNIDADE.match(seguinte) and not RE_VALOR.match(seguinte)
+        for token, seguinte in zip(tokens, tokens[1:])
+    )
+
+
+def pontuar_documento(texto: str, indice: IndiceTermos) -> dict:
+    """
+    Pontua de 0 a 1 o quanto o texto parece um laudo laboratorial, combinando os termos
+    do glossário encontrados, a fração de linhas com valor e unidade e as palavras típicas
+    de laudo. Texto curto demais (PDF escaneado sem camada de texto) recebe 0.
+    """
+    caracteres = len(re.sub(r"\s+", "", texto))
+    if caracteres < TRIAGEM_MIN_CARACTERES:
+        return {"pontuacao": 0.0, "motivo": "sem_texto", "caracteres": caracteres}
+
+    linhas = [linha for linha in texto.splitlines() if linha.strip()]
+    termos = len(indice.encontrar_termos(texto))
+    fracao_valores = sum(1 for linha in linhas if _linha_com_valor(linha)) / len(linhas)
+    palavras = set(re.findall(r"\w+", normalizar(texto)))
+    fracao_palavras = sum(1 for palavra in PALAVRAS_DE_LAUDO if palavra in palavras) / len(PALAVRAS_DE_LAUDO)
+
+    pontuacao = (
+        PESO_TERMOS * min(1.0, termos / TERMOS_ESPERADOS)
+        + PESO_VALORES * min(1.0, fracao_valores / FRACAO_LINHAS_COM_VALOR_ESPERADA)
+        + PESO_PALAVRAS * fracao_palavras
+    )
+    return {
+        "pontuacao": round(pontuacao, 4),
+        "motivo": "pontuacao",
+        "caracteres": caracteres,
+        "termos": termos,
+        "fracao_linhas_com_valor": round(fracao_valores, 4),
+        "fracao_palavras_de_laudo": round(fracao_palavras, 4),
+    }
+
+
+async def validar_documento(texto: str, indice: IndiceTermos) -> dict:
+    """
+    Decide se o texto segue para a extração. Levanta DocumentoRejeitado para documentos
+    que claramente não são laudos; na faixa ambígua consulta o classificador com IA.
+    """
+    if not TRIAGEM_ATIVA:
+        return {"decisao": "desativada"}
+
+    avaliacao = pontuar_documento(texto, indice)
+    pontuacao = avaliacao["pontuacao"]
+
+    if avaliacao["motivo"] == "sem_texto":
+        decisao = "rejeitado"
+    elif pontuacao >= TRIAGEM_LIMIAR_ACEITAR:
+        decisao = "aceito"
+    elif pontuacao < TRIAGEM_LIMIAR_REJEITAR:
+        decisao = "rejeitado"
+    elif not chave_configurada():
+        decisao = "ambiguo_aceito"
+    else:
+        try:
+            decisao = "ambiguo_aceito" if await validate_document_context(texto) else "ambiguo_rejeitado"
+        except Exception as e:
+            # Na dúvida, sem o classificador, o documento segue para a extração
+            print(f"Classificador de documentos indisponível, aceitando o documento: {e}")
+            decisao = "ambiguo_aceito"
+
+    triagem_documentos.inc(decisao, avaliacao["motivo"])
+    avaliacao["decisao"] = decisao
+    if decisao in ("rejeitado", "ambiguo_rejeitado"):
+        if avaliacao["motivo"] == "sem_texto":
+            raise DocumentoRejeitado(
+                "Não foi possível ler texto neste PDF. Se ele for uma imagem digitalizada, envie a versão digital do laudo."
+            )
+        raise DocumentoRejeitado("O documento enviado não parece ser um laudo de exames laboratoriais.")
+    return avaliacao
@@ -0,0 +1,67 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+# Uploads lidos em pedaços: até UPLOAD_SPOOL_BYTES ficam em memória, acima disso vão para um
+# arquivo temporário que os processos de leitura de PDF abrem com mmap, sem copiar os bytes
+UPLOAD_MAX_BYTES = int(os.getenv("MEDBOT_UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+UPLOAD_SPOOL_BYTES = int(os.getenv("MEDBOT_UPLOAD_SPOOL_BYTES", str(1024 * 1024)))
+UPLOAD_TAMANHO_PEDACO = 64 * 1024
+UPLOAD_DIR = os.getenv("MEDBOT_UPLOAD_DIR") or None
+
+
+class UploadMuitoGrande(Exception):
+    """O arquivo enviado passou do tamanho máximo permitido."""
+
+
+def mensagem_limite() -> str:
+    return f"O arquivo passou do limite de {round(UPLOAD_MAX_BYTES / (1024 * 1024), 1):g} MB."
+
+
+class UploadRecebido:
+    """
+    PDF recebido, com tamanho e hash calculados durante a cópia. `fonte` são os bytes
+    (uploads pequenos) ou o caminho do arquivo temporário; `fechar()` apaga o arquivo.
+    """
+
+    def __init__(self, fonte: bytes | Path, tamanho: int, sha256: str):
+        self.fonte = fonte
+        self.tamanho = tamanho
+        self.sha256 = sha256
+
+    def fechar(self) -> None:
+        if isinstance(self.fonte, Path):
+            self.fonte.unlink(missing_ok=True)
+
+
+async def receber_upload(arquivo) -> UploadRecebido:
+    """Copia o UploadFile em pedaços, recusando assim que passar de UPLOAD_MAX_BYTES."""
+    sha256 = hashlib.sha256()
+    memoria = bytearray()
+    destino = None
+    tamanho = 0
+    try:
+        while pedaco := await arquivo.read(UPLOAD_TAMANHO_PEDACO):
+            tamanho += len(pedaco)
+            if tamanho > UPLOAD_MAX_BYTES:
+                raise UploadMuitoGrande(mensagem_limite())
+            sha256.update(pedaco)
+            if destino is None and len(memoria) + len(pedaco) > UPLOAD_SPOOL_BYTES:
+                destino = tempfile.NamedTemporaryFile(prefix="medbot-", suffix=".pdf", dir=UPLOAD_DIR, delete=False)
+                destino.write(memoria)
+                memoria = bytearray()
+            if destino is None:
+                memoria += pedaco
+            else:
+                destino.write(pedaco)
+    except BaseException:
+        if destino is not None:
+            destino.close()
+            Path(destino.name).unlink(missing_ok=True)
+        raise
+
+    if destino is None:
+        return UploadRecebido(bytes(memoria), tamanho, sha256.hexdigest())
+    destino.close()
+    return UploadRecebido(Path(destino.name), tamanho, sha256.hexdigest())
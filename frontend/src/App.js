@@ -4,8 +4,12 @@ import { X, ChevronDown, Activity, AlertTriangle } from 'lucide-react';
 import ExameGif from './exame.gif';
 import ReactMarkdown from 'react-markdown';
 
+// Com sob demanda (padrão), as análises de IA só são geradas quando o grupo é aberto; com
+// REACT_APP_ANALISE_SOB_DEMANDA=false elas chegam pelo stream, uma a uma, assim que ficam prontas
+const ANALISE_SOB_DEMANDA = process.env.REACT_APP_ANALISE_SOB_DEMANDA !== 'false';
+
 // O componente do Acordeão permanece o mesmo
-const AccordionItem = ({ group, isOpen, onToggle }) => (
+const AccordionItem = ({ group, isOpen, onToggle, isStreaming, loadingAnalyses }) => (
   <div className="result-group">
     <button className="group-title-button" onClick={onToggle}>
       <h3 className="group-title">{group.group_name}</h3>
@@ -23,6 +27,13 @@ const AccordionItem = ({ group, isOpen, onToggle }) => (
                 <ReactMarkdown>{item.interpretacao}</ReactMarkdown>
             </div>
             
+            {!item.analise_ia && (isStreaming || loadingAnalyses[item.analise_id]) && ['alto', 'baixo'].includes(item.status_class) && (
+               <div className="ai-analysis-pending">
+                 <div className="spinner"></div>
+                 <span>Gerando análise com IA...</span>
+               </div>
+            )}
+
             {item.analise_ia && (
                <div className="ai-analysis">
                  <h5><Activity size={16} /> {item.analise_ia.titulo}</h5>
@@ -57,6 +68,8 @@ function App() {
   const [openGroups, setOpenGroups] = useState({});
   const [useRag, setUseRag] = useState(true); // Estado para controlar o uso do RAG
   const [ragModeUsed, setRagModeUsed] = useState(null); // Estado para exibir o modo usado
+  const [isStreaming, setIsStreaming] = useState(false); // Análises de IA ainda chegando
+  const [loadingAnalyses, setLoadingAnalyses] = useState({}); // Análises sob demanda em andamento, por analise_id
 
   const handleFileChange = (e) => {
     const file = e.target.files[0];
@@ -80,30 +93,88 @@ function App() {
     setError(''); 
     setResults([]); 
     setRagModeUsed(null);
+    // Grupos abertos no laudo anterior só pediriam as análises quando fossem reabertos
+    setOpenGroups({});
+    setLoadingAnalyses({});
 
     const formData = new FormData();
     formData.append('file', selectedFile);
     formData.append('idade', age);
     formData.append('sexo', sex);
     formData.append('rag', useRag); // Envia o modo RAG para o backend
+    formData.append('sob_demanda', ANALISE_SOB_DEMANDA);
 
     try {
-      const response = await fetch('http://127.0.0.1:8000/analyze-pdf/', { method: 'POST', body: formData });
-      const data = await response.json();
-      if (!response.ok) throw new Error(data.detail || `Erro do servidor: ${response.status}`);
-      
-      setResults(data.groups);
-      setRagModeUsed(data.rag_mode_used); // Armazena o modo que foi usado
+      // Streaming (NDJSON): os resultados aparecem assim que a extração termina
+      // e cada análise de IA é preenchida quando fica pronta
+      const response = await fetch('http://127.0.0.1:8000/analyze-pdf/stream/', { method: 'POST', body: formData });
+      if (!response.ok) {
+        const data = await response.json();
+        throw new Error(data.detail || `Erro do servidor: ${response.status}`);
+      }
+
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const lines = buffer.split('\n');
+        buffer = lines.pop();
+        lines.filter(line => line.trim()).forEach(line => handleStreamEvent(JSON.parse(line)));
+      }
 
     } catch (err) {
       setError(err.message || 'Ocorreu um erro ao se comunicar com o servidor.');
     } finally {
       setIsLoading(false);
+      setIsStreaming(false);
+    }
+  };
+
+  const handleStreamEvent = (event) => {
+    if (event.tipo === 'grupos') {
+      setResults(event.groups);
+      setRagModeUsed(event.rag_mode_used); // Armazena o modo que foi usado
+      setIsStreaming(event.analises_pendentes > 0);
+      setIsLoading(false);
+    } else if (event.tipo === 'analise') {
+      setResults(prev => prev.map((group, groupIndex) => groupIndex !== event.group_index ? group : {
+        ...group,
+        results: group.results.map((item, itemIndex) => itemIndex !== event.result_index ? item : { ...item, analise_ia: event.analise_ia }),
+      }));
+    } else if (event.tipo === 'erro') {
+      setError(event.detail);
+    }
+  };
+
+  const fetchAnalysis = async (groupIndex, item) => {
+    setLoadingAnalyses(prev => ({ ...prev, [item.analise_id]: true }));
+    try {
+      const response = await fetch(`http://127.0.0.1:8000/analysis/${item.analise_id}/`);
+      const data = await response.json();
+      if (!response.ok) throw new Error(data.detail || `Erro do servidor: ${response.status}`);
+      setResults(prev => prev.map((group, index) => index !== groupIndex ? group : {
+        ...group,
+        results: group.results.map(result => result.analise_id !== item.analise_id ? result : { ...result, analise_ia: data.analise_ia }),
+      }));
+    } catch (err) {
+      setError(err.message || 'Não foi possível gerar a análise com IA.');
+    } finally {
+      setLoadingAnalyses(prev => ({ ...prev, [item.analise_id]: false }));
     }
   };
 
   const toggleGroup = (index) => {
+    const opening = !openGroups[index];
     setOpenGroups(prev => ({ ...prev, [index]: !prev[index] }));
+    // Pede as análises dos resultados alterados do grupo na primeira vez que ele é aberto
+    if (opening && results[index]) {
+      results[index].results
+        .filter(item => item.analise_id && !item.analise_ia && !loadingAnalyses[item.analise_id])
+        .forEach(item => fetchAnalysis(index, item));
+    }
   };
 
   const handleDrop = (e) => { e.preventDefault(); e.stopPropagation(); e.currentTarget.classList.remove('drag-over'); const file = e.dataTransfer.files[0]; if (file) { setSelectedFile(file); setError(''); setResults([]); } };
@@ -170,6 +241,8 @@ function App() {
                 group={group}
                 isOpen={!!openGroups[groupIndex]}
                 onToggle={() => toggleGroup(groupIndex)}
+                isStreaming={isStreaming}
+                loadingAnalyses={loadingAnalyses}
               />
             ))}
           </div>
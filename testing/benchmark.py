@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+# --- Configurações ---
+# Benchmark de ponta a ponta sem a OpenAI: sobe a OpenAI falsa (fake_openai.py) e o backend
+# apontando para ela, dispara /analyze-pdf/ com a concorrência pedida e guarda o resumo em
+# testing/results/benchmarks/ para comparar com as execuções anteriores.
+TESTING_DIR = Path(__file__).parent
+BACKEND_DIR = TESTING_DIR.parent / "backend"
+PDF_TEST_DIR = TESTING_DIR / "pdfs"
+BENCHMARK_DIR = TESTING_DIR / "results" / "benchmarks"
+
+
+def percentil(valores, p):
+    """Percentil pelo método do posto mais próximo (valores já ordenados)."""
+    if not valores:
+        return None
+    posicao = max(0, min(len(valores) - 1, int(round(p / 100 * len(valores) + 0.5)) - 1))
+    return valores[posicao]
+
+
+def resumir(valores):
+    valores = sorted(valores)
+    if not valores:
+        return {}
+    return {
+        "p50": round(percentil(valores, 50), 4),
+        "p95": round(percentil(valores, 95), 4),
+        "p99": round(percentil(valores, 99), 4),
+        "media": round(sum(valores) / len(valores), 4),
+        "min": round(valores[0], 4),
+        "max": round(valores[-1], 4),
+    }
+
+
+def ler_server_timing(cabecalho):
+    """Converte 'extracao;dur=812.4, interpretacao;dur=1.2' em {'extracao': 0.8124, ...} (segundos)."""
+    etapas = {}
+    for parte in (cabecalho or "").split(","):
+        nome, _, resto = parte.strip().partition(";")
+        for parametro in resto.split(";"):
+            chave, _, valor = parametro.strip().partition("=")
+            if nome and chave == "dur":
+                etapas[nome] = float(valor) / 1000
+    return etapas
+
+
+def commit_atual():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=TESTING_DIR, capture_output=True, text=True, check=True).stdout.strip()
+        sujo = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=TESTING_DIR, capture_output=True, text=True).stdout.strip()
+        return commit + ("-sujo" if sujo else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "desconhecido"
+
+
+async def esperar_pronto(url, timeout=60):
+    limite = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < limite:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"O servidor em '{url}' não ficou pronto em {timeout}s.")
+
+
+def iniciar_servidores(args):
+    """Sobe a OpenAI falsa e o backend apontando para ela, com caches num diretório temporário."""
+    fake = subprocess.Popen([
+        sys.executable, str(TESTING_DIR / "fake_openai.py"), "--porta", str(args.porta_llm),
+        "--latencia-extracao", str(args.latencia_extracao), "--latencia-analise", str(args.latencia_analise),
+        "--latencia-lote", str(args.latencia_lote), "--taxa-429", str(args.taxa_429),
+    ])
+    env = {
+        **os.environ,
+        "OPENAI_API_KEY": "sk-benchmark",
+        "MEDBOT_LLM_BASE_URL": f"http://127.0.0.1:{args.porta_llm}/v1",
+        "MEDBOT_CACHE_DIR": tempfile.mkdtemp(prefix="medbot-benchmark-"),
+        "MEDBOT_SERVER_TIMING": "1",
+    }
+    if not args.com_cache:
+        # Cada requisição passa pelo pipeline inteiro, como um PDF nunca visto
+        env["MEDBOT_CACHE_ANALISES_TTL"] = "0"
+        env["MEDBOT_CACHE_DOCUMENTOS_TTL"] = "0"
+        # O mesmo PDF enviado em paralelo seria coalescido numa única extração e num único lote
+        env["MEDBOT_COALESCENCIA"] = "0"
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(args.porta_api), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env,
+    )
+    return [fake, backend]
+
+
+async def enviar(client, url, pdf_path, args):
+    """Faz uma requisição e devolve a latência total e as etapas medidas."""
+    files = {"file": (pdf_path.name, pdf_path.read_bytes(), "application/pdf")}
+    data = {"idade": args.idade, "sexo": args.sexo, "rag": str(args.rag).lower()}
+    inicio = time.perf_counter()
+    try:
+        if not args.stream:
+            resposta = await client.post(url, files=files, data=data)
+            latencia = time.perf_counter() - inicio
+            return {"ok": resposta.status_code == 200, "status": resposta.status_code, "latencia": latencia, "etapas": ler_server_timing(resposta.headers.get("server-timing"))}
+
+        # No streaming, as etapas visíveis pelo cliente são a chegada dos grupos e o fim das análises
+        etapas = {}
+        async with client.stream("POST", url, files=files, data=data) as resposta:
+            async for linha in resposta.aiter_lines():
+                if not linha:
+                    continue
+                evento = json.loads(linha)
+                if evento.get("tipo") == "grupos":
+                    etapas["primeiros_grupos"] = time.perf_counter() - inicio
+                elif evento.get("tipo") == "erro":
+                    return {"ok": False, "status": resposta.status_code, "latencia": time.perf_counter() - inicio, "etapas": etapas}
+            etapas.update(ler_server_timing(resposta.headers.get("server-timing")))
+            return {"ok": resposta.status_code == 200, "status": resposta.status_code, "latencia": time.perf_counter() - inicio, "etapas": etapas}
+    except httpx.HTTPError as e:
+        print(f"    ERRO na requisição: {e}")
+        return {"ok": False, "status": None, "latencia": time.perf_counter() - inicio, "etapas": {}}
+
+
+async def rodar_nivel(url_api, url_llm, pdfs, concorrencia, args):
+    """Roda `args.requisicoes` requisições com até `concorrencia` em paralelo."""
+    semaforo = asyncio.Semaphore(concorrencia)
+    limites = httpx.Limits(max_connections=concorrencia, max_keepalive_connections=concorrencia)
+
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limites) as client:
+        if url_llm:
+            await client.post(f"{url_llm}/stats/reset")
+
+        async def uma(i):
+            async with semaforo:
+                return await enviar(client, url_api, pdfs[i % len(pdfs)], args)
+
+        inicio = time.perf_counter()
+        medicoes = await asyncio.gather(*(uma(i) for i in range(args.requisicoes)))
+        duracao = time.perf_counter() - inicio
+        chamadas_llm = (await client.get(f"{url_llm}/stats")).json() if url_llm else {}
+
+    sucessos = [m for m in medicoes if m["ok"]]
+    nomes_etapas = sorted({nome for m in sucessos for nome in m["etapas"]})
+    return {
+        "concorrencia": concorrencia,
+        "requisicoes": len(medicoes),
+        "erros": len(medicoes) - len(sucessos),
+        "duracao_segundos": round(duracao, 3),
+        "vazao_req_por_segundo": round(len(sucessos) / duracao, 3) if duracao else 0.0,
+        "latencia": resumir([m["latencia"] for m in sucessos]),
+        "etapas": {nome: resumir([m["etapas"][nome] for m in sucessos if nome in m["etapas"]]) for nome in nomes_etapas},
+        "llm_por_requisicao": {chave: round(valor / len(medicoes), 2) for chave, valor in sorted(chamadas_llm.items())},
+    }
+
+
+def imprimir_nivel(nivel, anterior=None):
+    lat = nivel["latencia"]
+    print(f"\n--- Concorrência {nivel['concorrencia']} ---")
+    print(f"  {nivel['requisicoes']} requisições, {nivel['erros']} erros, {nivel['vazao_req_por_segundo']} req/s")
+    if lat:
+        print(f"  Latência: p50 {lat['p50']:.3f}s | p95 {lat['p95']:.3f}s | p99 {lat['p99']:.3f}s")
+    for nome, etapa in nivel["etapas"].items():
+        print(f"    {nome}: p50 {etapa['p50']:.3f}s | p95 {etapa['p95']:.3f}s")
+    if nivel["llm_por_requisicao"]:
+        print(f"  Chamadas ao modelo por requisição: {nivel['llm_por_requisicao']}")
+    if anterior and anterior.get("latencia") and lat:
+        def variacao(atual, antes):
+            return f"{(atual - antes) / antes * 100:+.1f}%" if antes else "n/a"
+        print(
+            f"  Comparado à execução anterior: p50 {variacao(lat['p50'], anterior['latencia']['p50'])}"
+            f" | p95 {variacao(lat['p95'], anterior['latencia']['p95'])}"
+            f" | vazão {variacao(nivel['vazao_req_por_segundo'], anterior['vazao_req_por_segundo'])}"
+        )
+
+
+def carregar_anterior(caminho):
+    if caminho == "ultimo":
+        arquivos = sorted(BENCHMARK_DIR.glob("benchmark_*.json"))
+        if not arquivos:
+            return None
+        caminho = arquivos[-1]
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)
+
+
+async def executar(args):
+    pdfs = sorted(PDF_TEST_DIR.glob("*.pdf"))
+    if not pdfs:
+        print(f"Nenhum PDF encontrado em '{PDF_TEST_DIR}'.")
+        return
+
+    processos = []
+    if args.url:
+        url_base, url_llm = args.url.rstrip("/"), args.url_llm
+    else:
+        processos = iniciar_servidores(args)
+        url_base, url_llm = f"http://127.0.0.1:{args.porta_api}", f"http://127.0.0.1:{args.porta_llm}"
+    url_api = f"{url_base}{'/analyze-pdf/stream/' if args.stream else '/analyze-pdf/'}"
+
+    anterior = carregar_anterior(args.comparar) if args.comparar else None
+    niveis_anteriores = {n["concorrencia"]: n for n in (anterior or {}).get("niveis", [])}
+
+    try:
+        await esperar_pronto(f"{url_base}/health/ready" if not args.url else f"{url_base}/")
+        # Aquecimento: carrega o pool de PDFs e as conexões antes de medir
+        async with httpx.AsyncClient(timeout=args.timeout) as client:
+            await enviar(client, url_api, pdfs[0], args)
+
+        print(f"Benchmark de '{url_api}' com {len(pdfs)} PDF(s), {args.requisicoes} requisições por nível.")
+        niveis = []
+        for concorrencia in args.concorrencia:
+            nivel = await rodar_nivel(url_api, url_llm, pdfs, concorrencia, args)
+            imprimir_nivel(nivel, niveis_anteriores.get(concorrencia))
+            niveis.append(nivel)
+    finally:
+        for processo in processos:
+            processo.terminate()
+        for processo in processos:
+            processo.wait(timeout=10)
+
+    commit = commit_atual()
+    resultado = {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "config": {chave: valor for chave, valor in vars(args).items() if chave != "comparar"},
+        "niveis": niveis,
+    }
+    BENCHMARK_DIR.mkdir(parents=True, exist_ok=True)
+    arquivo = BENCHMARK_DIR / f"benchmark_{datetime.now():%Y%m%d-%H%M%S}_{commit}.json"
+    with open(arquivo, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados salvos em '{arquivo}'")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark offline do /analyze-pdf/ com respostas gravadas do modelo.")
+    parser.add_argument("--concorrencia", type=int, nargs="+", default=[1, 4, 16], help="Níveis de concorrência a medir.")
+    parser.add_argument("--requisicoes", type=int, default=20, help="Requisições por nível de concorrência.")
+    parser.add_argument("--stream", action="store_true", help="Usa /analyze-pdf/stream/ em vez de /analyze-pdf/.")
+    parser.add_argument("--sem-rag", dest="rag", action="store_false", help="Envia rag=false.")
+    parser.add_argument("--idade", type=int, default=35)
+    parser.add_argument("--sexo", default="feminino")
+    parser.add_argument("--com-cache", action="store_true", help="Mantém os caches de extração e de análises e a coalescência de requisições iguais ligados.")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--url", help="Usa um backend já rodando (ex: http://127.0.0.1:8000) em vez de subir um.")
+    parser.add_argument("--url-llm", help="URL da OpenAI falsa já rodando, para contar as chamadas ao modelo.")
+    parser.add_argument("--porta-api", type=int, default=8100)
+    parser.add_argument("--porta-llm", type=int, default=8101)
+    parser.add_argument("--latencia-extracao", type=float, default=2.0)
+    parser.add_argument("--latencia-analise", type=float, default=1.5)
+    parser.add_argument("--latencia-lote", type=float, default=3.0)
+    parser.add_argument("--taxa-429", type=float, default=0.0)
+    parser.add_argument("--comparar", default="ultimo", help="Resultado anterior para comparar ('ultimo', um arquivo ou '' para não comparar).")
+    asyncio.run(executar(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import unicodedata
+import uuid
+from collections import Counter
+from pathlib import Path
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# --- Configurações ---
+# Servidor local compatível com a API de chat da OpenAI que responde com as saídas gravadas
+# em testing/results/comparison_*.json. Aponte o backend para ele com
+# MEDBOT_LLM_BASE_URL=http://127.0.0.1:8101/v1 para rodar sem a OpenAI de verdade.
+RESULTS_DIR = Path(__file__).parent / "results"
+
+app = FastAPI(title="OpenAI falsa para benchmarks")
+
+config = {
+    "latencia_extracao": 2.0,
+    "latencia_analise": 1.5,
+    "latencia_lote": 3.0,
+    "latencia_classificacao": 0.5,
+    "jitter": 0.2,
+    "taxa_429": 0.0,
+}
+gravacoes = {"resultados": {}, "analises": {}}
+contadores = Counter()
+_aleatorio = random.Random(42)
+
+
+def normalizar(texto):
+    sem_acentos = "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", sem_acentos.lower()).strip()
+
+
+def carregar_gravacoes(pasta=RESULTS_DIR):
+    """Lê os resultados e as análises gravados pelo test_evaluation.py."""
+    for arquivo in sorted(pasta.glob("comparison_*.json")):
+        with open(arquivo, encoding="utf-8") as f:
+            dados = json.load(f)
+        for chave, rag in (("output_with_rag", True), ("output_without_rag", False)):
+            for grupo in (dados.get(chave) or {}).get("groups", []):
+                for r in grupo.get("results", []):
+                    nome = normalizar(r["exame"])
+                    gravacoes["resultados"].setdefault(nome, (grupo["group_name"], {k: r[k] for k in ("exame", "valor", "unidade")}))
+                    if r.get("analise_ia"):
+                        gravacoes["analises"].setdefault((rag, nome), r["analise_ia"])
+    print(f"{len(gravacoes['resultados'])} resultados e {len(gravacoes['analises'])} análises gravados carregados.")
+
+
+def analise_gravada(termo, rag):
+    analise = gravacoes["analises"].get((rag, normalizar(termo))) or gravacoes["analises"].get((not rag, normalizar(termo)))
+    if analise:
+        return dict(analise)
+    return {
+        "titulo": f"{termo.title()} Alterado",
+        "analise": f"🩺 Resultado de **{termo}** fora da faixa de referência.",
+        "recomendacao": "🧑‍⚕️ Procure um **médico** para avaliar o resultado.",
+        "alerta": "⚠️ Esta análise não é um diagnóstico.",
+    }
+
+
+def responder_extracao(conteudo):
+    texto = normalizar(conteudo.split("Texto do exame:", 1)[-1])
+    grupos = {}
+    for nome, (grupo, resultado) in gravacoes["resultados"].items():
+        if re.search(rf"(?<![\w.]){re.escape(nome)}(?!\w)", texto):
+            grupos.setdefault(grupo, []).append(resultado)
+    return {"grupos": [{"grupo": nome, "resultados": resultados} for nome, resultados in grupos.items()]}
+
+
+def responder_lote(conteudo, rag):
+    inicio = conteudo.index("**Exames (JSON):**") + len("**Exames (JSON):**")
+    exames, _ = json.JSONDecoder().raw_decode(conteudo[inicio:].lstrip())
+    return {"analises": [{"id": e["id"], **analise_gravada(e["termo"], rag)} for e in exames]}
+
+
+def classificar(mensagens):
+    """Descobre o tipo de chamada pelo prompt e monta a resposta gravada correspondente."""
+    sistema = next((m["content"] for m in mensagens if m["role"] == "system"), "")
+    usuario = next((m["content"] for m in mensagens if m["role"] == "user"), "")
+    rag = "conhecimento médico geral" not in sistema
+    if "classificador de documentos" in sistema:
+        return "classificacao", "SIM", config["latencia_classificacao"]
+    if "extrai dados estruturados" in sistema:
+        return "extracao", responder_extracao(usuario), config["latencia_extracao"]
+    if "**Exames (JSON):**" in usuario:
+        return "lote", responder_lote(usuario, rag), config["latencia_lote"]
+    termo = re.search(r'\*\*Termo:\*\* "(.*?)"', usuario)
+    return "analise", analise_gravada(termo.group(1) if termo else "exame", rag), config["latencia_analise"]
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    corpo = await request.json()
+    mensagens = corpo.get("messages", [])
+    tipo, resposta, latencia = classificar(mensagens)
+    contadores[f"chamadas_{tipo}"] += 1
+
+    if _aleatorio.random() < config["taxa_429"]:
+        contadores["respostas_429"] += 1
+        return JSONResponse(status_code=429, content={"error": {"message": "Rate limit (simulado)", "type": "rate_limit"}})
+
+    await asyncio.sleep(max(0.0, latencia * (1 + _aleatorio.uniform(-config["jitter"], config["jitter"]))))
+
+    conteudo = resposta if isinstance(resposta, str) else json.dumps(resposta, ensure_ascii=False)
+    # Tokens estimados em ~4 caracteres cada, só para as métricas de uso
+    tokens_prompt = sum(len(m.get("content") or "") for m in mensagens) // 4
+    tokens_resposta = len(conteudo) // 4
+    contadores[f"tokens_prompt_{tipo}"] += tokens_prompt
+    contadores[f"tokens_resposta_{tipo}"] += tokens_resposta
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": corpo.get("model", "gpt-4o"),
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": conteudo}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": tokens_prompt, "completion_tokens": tokens_resposta, "total_tokens": tokens_prompt + tokens_resposta},
+    }
+
+
+@app.get("/stats")
+def stats():
+    return dict(contadores)
+
+
+@app.post("/stats/reset")
+def reset_stats():
+    contadores.clear()
+    return {"status": "ok"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI falsa que responde com as saídas gravadas.")
+    parser.add_argument("--porta", type=int, default=8101)
+    parser.add_argument("--latencia-extracao", type=float, default=config["latencia_extracao"], help="Segundos por chamada de extração.")
+    parser.add_argument("--latencia-analise", type=float, default=config["latencia_analise"], help="Segundos por análise individual.")
+    parser.add_argument("--latencia-lote", type=float, default=config["latencia_lote"], help="Segundos por análise em lote.")
+    parser.add_argument("--jitter", type=float, default=config["jitter"], help="Variação relativa das latências (0.2 = ±20%%).")
+    parser.add_argument("--taxa-429", type=float, default=config["taxa_429"], help="Fração das chamadas respondidas com 429.")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    config.update(
+        latencia_extracao=args.latencia_extracao, latencia_analise=args.latencia_analise,
+        latencia_lote=args.latencia_lote, jitter=args.jitter, taxa_429=args.taxa_429,
+    )
+    _aleatorio.seed(args.semente)
+    carregar_gravacoes()
+    uvicorn.run(app, host="127.0.0.1", port=args.porta, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()